@@ -1,112 +1,132 @@
 import re
-from core.database import load_records
+from core.database import load_records, indexed_ids, get_records_by_ids, scan_records
 from datetime import datetime
 
+# Evaluation order for complex_search: exact and index-backed conditions are
+# the most selective and cheapest, regex and empty-field checks the least.
+CONDITION_COST = {'equals': 0, 'contains': 1, 'regex': 2, 'empty': 3}
+
 class AdvancedSearch:
     @staticmethod
     def regex_search(pattern, field='all'):
 
-        records = load_records()
-        results = []
-        
         try:
             regex = re.compile(pattern, re.IGNORECASE)
         except re.error:
             return []
         
-        for record in records:
-            if field == 'all':
-                text_to_search = f"{record.get('first_name', '')} {record.get('last_name', '')} {record.get('address', '')} {record.get('national_id', '')} {record.get('phone', '')}"
-                if regex.search(text_to_search):
-                    results.append(record)
-            elif field in record:
-                if record[field] and regex.search(str(record[field])):
-                    results.append(record)
-        
-        return results
+        if field == 'all':
+            fields = ('first_name', 'last_name', 'address', 'national_id', 'phone')
+            return scan_records(fields, lambda *values: bool(regex.search(" ".join(str(v or "") for v in values))))
+        return scan_records(field, lambda value: bool(value) and bool(regex.search(str(value))))
     
     @staticmethod
     def date_search(date_filter, field='created_at'):
-        records = load_records()
-        results = []
-        
         try:
             target_date = datetime.strptime(date_filter, '%Y-%m-%d').date()
         except ValueError:
             return []
         
-        for record in records:
-            if field in record and record[field]:
-                try:
-                    record_date = datetime.strptime(record[field][:10], '%Y-%m-%d').date()
-                    if record_date == target_date:
-                        results.append(record)
-                except ValueError:
-                    continue
+        def on_date(value):
+            try:
+                return bool(value) and datetime.strptime(value[:10], '%Y-%m-%d').date() == target_date
+            except ValueError:
+                return False
         
-        return results
+        return scan_records(field, on_date)
     
     @staticmethod
     def empty_field_search(field):
-        records = load_records()
-        results = []
-        
-        for record in records:
-            if not record.get(field):
-                results.append(record)
-        
-        return results
+        return scan_records(field, lambda value: not value)
     
     @staticmethod
     def range_search(field, min_val=None, max_val=None):
-        records = load_records()
-        results = []
-        
-        for record in records:
-            value = record.get(field)
-            if value and value.isdigit():
-                num_value = int(value)
-                if (min_val is None or num_value >= min_val) and (max_val is None or num_value <= max_val):
-                    results.append(record)
+        def in_range(value):
+            if not value or not value.isdigit():
+                return False
+            num_value = int(value)
+            return (min_val is None or num_value >= min_val) and (max_val is None or num_value <= max_val)
         
-        return results
+        return scan_records(field, in_range)
     
     @staticmethod
     def complex_search(filters):
-        records = load_records()
-        results = []
+        plan = AdvancedSearch.plan(filters)
+        
+        if any(step['never'] for step in plan):
+            return []
         
-        for record in records:
-            match = True
+        candidates = None
+        for step in plan:
+            if step['ids'] is not None:
+                candidates = step['ids'] if candidates is None else candidates & step['ids']
+        
+        records = load_records() if candidates is None else get_records_by_ids(candidates)
+        predicates = [step['predicate'] for step in plan]
+        
+        return [record for record in records if all(p(record) for p in predicates)]
+    
+    @staticmethod
+    def plan(filters):
+        """Compile every condition once and order them by estimated selectivity"""
+        plan = []
+        
+        for field, condition in filters.items():
+            ctype = condition.get('type')
+            predicate = AdvancedSearch._compile_condition(field, condition)
+            ids = None
             
-            for field, condition in filters.items():
-                if not AdvancedSearch._check_condition(record, field, condition):
-                    match = False
-                    break
+            # A missing value is compared as str(None), so only terms that
+            # cannot match 'None' may be answered from an index.
+            value = condition.get('value')
+            if ctype == 'equals' and value and value != 'None':
+                ids = indexed_ids(field, value, exact=True)
+            elif ctype == 'contains' and value and value.lower() not in 'none':
+                ids = indexed_ids(field, value, exact=False)
             
-            if match:
-                results.append(record)
-        
-        return results
+            if ctype == 'equals' or ids is not None:
+                rank = (0, len(ids) if ids is not None else float('inf'))
+            else:
+                rank = (CONDITION_COST.get(ctype, len(CONDITION_COST)), 0)
+            
+            plan.append({
+                'field': field,
+                'type': ctype,
+                'predicate': predicate,
+                'ids': ids,
+                'never': predicate is None,
+                'rank': rank
+            })
+        
+        plan.sort(key=lambda step: step['rank'])
+        return plan
     
     @staticmethod
-    def _check_condition(record, field, condition):
-        value = record.get(field, '')
+    def _compile_condition(field, condition):
+        """Predicate for one condition, or None if nothing can ever match"""
+        ctype = condition.get('type')
         
-        if condition.get('type') == 'regex':
+        if ctype == 'regex':
             try:
                 regex = re.compile(condition['pattern'], re.IGNORECASE)
-                return bool(regex.search(str(value)))
             except re.error:
-                return False
+                return None
+            return lambda record: bool(regex.search(str(record.get(field, ''))))
         
-        elif condition.get('type') == 'empty':
-            return not value
+        elif ctype == 'empty':
+            return lambda record: not record.get(field, '')
         
-        elif condition.get('type') == 'equals':
-            return str(value) == condition['value']
+        elif ctype == 'equals':
+            expected = condition['value']
+            return lambda record: str(record.get(field, '')) == expected
         
-        elif condition.get('type') == 'contains':
-            return condition['value'].lower() in str(value).lower()
+        elif ctype == 'contains':
+            term = condition['value'].lower()
+            return lambda record: term in str(record.get(field, '')).lower()
         
-        return False
\ No newline at end of file
+        return None
+    
+    @staticmethod
+    def _check_condition(record, field, condition):
+        predicate = AdvancedSearch._compile_condition(field, condition)
+        return predicate(record) if predicate else False
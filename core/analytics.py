@@ -1,6 +1,10 @@
-from core.database import load_records
+from core.database import get_record_summary
+from core.indexes import QUALITY_FIELDS
+from core.storage import get_store
 from core.auth import load_users
 from core.config_manager import get_autobackup_config
+from core.log_events import query_events
+from core import event_counters
 from core.utils import LOG_PATH, BACKUP_DIR
 from datetime import datetime, timedelta
 import os
@@ -8,70 +12,71 @@ import json
 
 class Analytics:
     
+    # every record-based figure comes from the column summary maintained by
+    # RecordStats; pass one summary around to build several reports from it
+    
     @staticmethod
-    def user_activity_report():
+    def user_activity_report(summary=None):
         users = load_users()
-        records = load_records()
+        summary = summary or get_record_summary()
         
         report = {
             "total_users": len(users),
-            "total_records": len(records),
+            "total_records": summary["total_records"],
             "users_by_role": {},
-            "recent_activity": "Coming soon"
+            "recent_activity": {}
         }
         
         for user_data in users.values():
             role = user_data.get('role', 'viewer')
             report["users_by_role"][role] = report["users_by_role"].get(role, 0) + 1
         
+        # last 7 days per user, from the event index rather than the log itself
+        since = (datetime.utcnow() - timedelta(days=7)).isoformat(sep=" ", timespec="seconds")
+        for event in query_events(since=since):
+            if not event["user"]:
+                continue
+            activity = report["recent_activity"].setdefault(
+                event["user"], {"events": 0, "logins": 0, "failed_logins": 0, "last_seen": None})
+            activity["events"] += 1
+            if event["type"] == "LOGIN":
+                activity["logins"] += 1
+            elif event["type"] == "LOGIN_FAIL":
+                activity["failed_logins"] += 1
+            activity["last_seen"] = event["timestamp"]
+        
         return report
     
     @staticmethod
-    def data_quality_report():
-        records = load_records()
+    def data_quality_report(summary=None):
+        summary = summary or get_record_summary()
+        total = summary["total_records"]
         
-        if not records:
+        if not total:
             return {"error": "No records available"}
         
         report = {
-            "total_records": len(records),
+            "total_records": total,
             "completeness": {},
             "validity": {}
         }
         
-        fields_to_check = ['first_name', 'last_name', 'national_id', 'phone', 'address']
-        for field in fields_to_check:
-            filled_count = sum(1 for record in records if record.get(field))
-            percentage = (filled_count / len(records)) * 100
-            report["completeness"][field] = f"{percentage:.1f}% ({filled_count}/{len(records)})"
-        
-        from core.validators import DataValidator
-        
-        valid_national_ids = 0
-        valid_phones = 0
-        
-        for record in records:
-            if record.get('national_id'):
-                is_valid, _ = DataValidator.validate_national_id(record['national_id'])
-                if is_valid:
-                    valid_national_ids += 1
-            
-            if record.get('phone'):
-                is_valid, _ = DataValidator.validate_iranian_phone(record['phone'])
-                if is_valid:
-                    valid_phones += 1
+        for field in QUALITY_FIELDS:
+            filled_count = summary["filled"][field]
+            percentage = (filled_count / total) * 100
+            report["completeness"][field] = f"{percentage:.1f}% ({filled_count}/{total})"
         
-        report["validity"]["national_ids"] = f"{valid_national_ids} valid"
-        report["validity"]["phones"] = f"{valid_phones} valid"
+        report["validity"]["national_ids"] = f"{summary['valid_national_ids']} valid"
+        report["validity"]["phones"] = f"{summary['valid_phones']} valid"
         
         return report
     
     @staticmethod
-    def system_status_report():
-        records = load_records()
+    def system_status_report(summary=None):
+        summary = summary or get_record_summary()
         backup_config = get_autobackup_config()
         
-        records_size = os.path.getsize(os.path.join(os.path.dirname(__file__), '..', 'data', 'records.enc')) if os.path.exists(os.path.join(os.path.dirname(__file__), '..', 'data', 'records.enc')) else 0
+        records_size = get_store().disk_size()
         logs_size = os.path.getsize(LOG_PATH) if os.path.exists(LOG_PATH) else 0
         
         backup_size = 0
@@ -82,7 +87,7 @@ class Analytics:
         
         report = {
             "storage_usage": {
-                "records": f"{len(records)} records ({records_size / 1024:.1f} KB)",
+                "records": f"{summary['total_records']} records ({records_size / 1024:.1f} KB)",
                 "backups": f"{backup_size / 1024:.1f} KB",
                 "logs": f"{logs_size / 1024:.1f} KB"
             },
@@ -97,29 +102,31 @@ class Analytics:
     
     @staticmethod
     def security_report():
-        log_entries = []
-        if os.path.exists(LOG_PATH):
-            try:
-                with open(LOG_PATH, 'r', encoding='utf-8') as f:
-                    log_entries = f.readlines()[-100:] 
-            except:
-                log_entries = []
-        
-        failed_logins = 0
-        security_events = 0
-        
-        for line in log_entries:
-            if 'LOGIN_FAIL' in line:
-                failed_logins += 1
-            if 'SECURITY_WARNING' in line or 'AUTOBACKUP' in line or 'USERADD' in line or 'USERDEL' in line:
-                security_events += 1
+        # rolling counters, so the report covers the whole window at O(buckets)
+        since = datetime.utcnow() - timedelta(days=1)
+        try:
+            counts = event_counters.totals(since)
+            rate = event_counters.failed_login_rate(since)
+            trend = [
+                {"hour": hour, "failed_logins": failed, "security_events": events}
+                for (hour, failed), (_, events) in zip(event_counters.trend("hour", 24, "failed_logins"),
+                                                       event_counters.trend("hour", 24, "security_events"))
+            ]
+        except Exception:
+            counts, rate, trend = {}, 0.0, []
+        
+        failed_logins = counts.get("failed_logins", 0)
+        security_events = counts.get("security_events", 0)
         
         report = {
             "recent_activity": {
-                "failed_logins": failed_logins,
-                "security_events": security_events,
-                "total_log_entries": len(log_entries)
+                "failed_logins (24h)": failed_logins,
+                "failed_logins_per_hour": round(rate, 2),
+                "security_events (24h)": security_events,
+                "successful_logins (24h)": counts.get("logins", 0),
+                "total_log_entries (24h)": counts.get("events", 0)
             },
+            "security_trend": trend,
             "recommendations": []
         }
         
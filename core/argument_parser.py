@@ -45,6 +45,9 @@ def parse_arguments(args, command):
         },
         'export': {
             'filename': r'-f\s+([^-]\S+)'
+        },
+        'import': {
+            'filename': r'-f\s+([^-]\S+)'
         }
     }
     
@@ -200,6 +203,15 @@ def handle_export_arguments(parts):
     args = parse_arguments(parts[1:], 'export')
     return args
 
+def handle_import_arguments(parts):
+    args = parse_arguments(parts[1:], 'import')
+    
+    if 'filename' not in args:
+        print("Error: Missing required argument -f")
+        return None
+    
+    return args
+
 def show_command_help(command):
     helps = {
         'useradd': """
@@ -273,6 +285,14 @@ export [-f FILENAME] [-y]
   -f  Custom filename
   -y  Auto confirm
 Example: export -f my_data.csv -y
+""",
+        'import': """
+import -f FILENAME [-y]
+  -f  CSV or JSON file to import (required)
+      CSV columns / JSON keys: first_name, last_name, national_id,
+      dob, phone, address (or city), tags, notes
+  -y  Auto confirm
+Example: import -f people.csv -y
 """,
         'status': """
 status [OPTIONS]
@@ -1,22 +1,36 @@
 # core/auth.py
 import os, json
+import threading
 import bcrypt
-from cryptography.fernet import Fernet
+from contextlib import contextmanager
 from core.utils import USERS_PATH
-from core.logger import log
-from core.config_manager import get_encryption_key
+from core.logger import log_event
+from core.config_manager import get_fernet, get_auth_config
+from core.file_lock import lock_for, atomic_write
 
-def generate_default_users():
-    return users
+# Users are decrypted once per process and kept until users.enc changes on
+# disk (stat check, so edits from other processes are seen) or is saved here.
+_users_lock = threading.Lock()
+_users_cache = {"stat": None, "users": None}
 
-def load_users():    
+# bcrypt("root"): the default account needs no fresh hash (and its CPU cost)
+# every time users.enc is missing or unreadable
+DEFAULT_ROOT_HASH = "$2b$12$IlfyKXeYNxfyVxU8gNh85eAxygF7xYmGGWmQKR9/pxY1ythcdu7Cy"
+
+def _users_stat():
+    try:
+        st = os.stat(USERS_PATH)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+def _read_users():
+    # caller holds the users file lock
     if os.path.exists(USERS_PATH):
         try:
-            key = get_encryption_key()
             with open(USERS_PATH, "rb") as f:
                 token = f.read()
-            fernet = Fernet(key)
-            data = fernet.decrypt(token)
+            data = get_fernet().decrypt(token)
             users_list = json.loads(data.decode())
             return {u["username"]: u for u in users_list}
         except Exception:
@@ -24,41 +38,90 @@ def load_users():
     
     return generate_default_users()
 
+def _cached_users():
+    """The shared user directory; read-only, callers must not change it"""
+    with _users_lock:
+        if _users_cache["users"] is not None and _users_stat() == _users_cache["stat"]:
+            return _users_cache["users"]
+    # the file lock always comes before _users_lock (save_users holds it while
+    # swapping the cache), so the read happens outside _users_lock
+    with lock_for(USERS_PATH).shared():
+        stat = _users_stat()
+        users = _read_users()
+        with _users_lock:
+            _users_cache["users"] = users
+            _users_cache["stat"] = stat
+    return users
+
+def load_users():
+    return {name: dict(user) for name, user in _cached_users().items()}
+
+def user_count():
+    return len(_cached_users())
+
 def generate_default_users():
-    import bcrypt
-    
-    root_hash = bcrypt.hashpw("root".encode(), bcrypt.gensalt()).decode()
-    
     users = {
         "root": {
             "username": "root",
-            "password": root_hash,
+            "password": DEFAULT_ROOT_HASH,
             "role": "root"
         },
     }
     return users
 
 def save_users(users_dict):
-    key = get_encryption_key()
-    fernet = Fernet(key)
+    fernet = get_fernet()
     users_list = list(users_dict.values())
     data = json.dumps(users_list, ensure_ascii=False).encode()
     token = fernet.encrypt(data)
     
-    os.makedirs(os.path.dirname(USERS_PATH), exist_ok=True)
-    
-    with open(USERS_PATH, "wb") as fh:
-        fh.write(token)
+    with lock_for(USERS_PATH).exclusive():
+        atomic_write(USERS_PATH, token)
+        with _users_lock:
+            _users_cache["users"] = {name: dict(user) for name, user in users_dict.items()}
+            _users_cache["stat"] = _users_stat()
+
+@contextmanager
+def edit_users():
+    """Load users for changing and save them when the block ends, all under the
+    exclusive users lock so edits from other processes are not lost. Keep the
+    block short: no prompts inside it."""
+    with lock_for(USERS_PATH).exclusive():
+        users = load_users()
+        yield users
+        save_users(users)
+
+def _rounds():
+    return min(31, max(4, int(get_auth_config()["bcrypt_rounds"])))
+
+def hash_password(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(_rounds())).decode()
+
+def _hash_rounds(stored_hash):
+    try:
+        return int(stored_hash.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+def _rehash(username, password, stored_hash):
+    """Store a hash made with the configured cost, unless the password changed meanwhile"""
+    new_hash = hash_password(password)
+    try:
+        with edit_users() as users:
+            user = users.get(username)
+            if user and user["password"] == stored_hash:
+                user["password"] = new_hash
+    except Exception:
+        pass
 
 def verify(username, password):
     try:
-        users = load_users()
+        user = _cached_users().get(username)
     except Exception:
         return None
         
-    user = users.get(username)
     if not user:
-        log(f"LOGIN_FAIL: user={username}")
+        log_event("LOGIN_FAIL", "login failed", user=username)
         return None
         
     stored_hash = user["password"].encode('utf-8')
@@ -67,8 +130,29 @@ def verify(username, password):
     ok = bcrypt.checkpw(input_password, stored_hash)
     
     if ok:
-        log(f"LOGIN: user={username}")
+        log_event("LOGIN", "login succeeded", user=username)
+        if _hash_rounds(user["password"]) != _rounds():
+            _rehash(username, password, user["password"])
         return {"username": username, "role": user.get("role", "viewer")}
     else:
-        log(f"LOGIN_FAIL: user={username}")
-    return None
\ No newline at end of file
+        log_event("LOGIN_FAIL", "login failed", user=username)
+    return None
+
+def attempt_login(username, password, client=None):
+    """verify() behind the login throttle: (user_info, retry_after). retry_after
+    is the seconds to wait when the attempt was turned away unchecked.
+    Raises login_throttle.LoginBusy, without counting the attempt, when the
+    password checks are all taken."""
+    from core import login_throttle
+    
+    wait, first = login_throttle.acquire(username, client)
+    if wait:
+        if first:
+            log_event("LOGIN_THROTTLED", f"too many attempts from {client or 'local'}", user=username)
+        return None, wait
+    
+    try:
+        return login_throttle.run_check(verify, username, password), 0.0
+    except login_throttle.LoginBusy:
+        login_throttle.refund(username, client)
+        raise
@@ -0,0 +1,33 @@
+# core/batch_validation.py
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Below this many items a process pool costs more to start than it saves
+PARALLEL_THRESHOLD = 5000
+CHUNK_SIZE = 2000
+
+
+def parallel_map(func, items, threshold=PARALLEL_THRESHOLD, chunk_size=CHUNK_SIZE, workers=None):
+    """Apply a top-level function to every item, in order, over a process pool
+    in chunks; small inputs or a missing pool run serially in this process."""
+    items = list(items)
+    workers = workers or os.cpu_count() or 1
+    if len(items) < threshold or workers < 2:
+        return [func(item) for item in items]
+
+    chunks = [(func, items[i:i + chunk_size]) for i in range(0, len(items), chunk_size)]
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            results = []
+            for part in pool.map(_run_chunk, chunks):
+                results.extend(part)
+            return results
+    except (OSError, BrokenProcessPool) as e:
+        print(f"Parallel validation unavailable, running serially: {e}")
+        return [func(item) for item in items]
+
+
+def _run_chunk(job):
+    func, items = job
+    return [func(item) for item in items]
@@ -58,8 +58,8 @@ class BootManager:
     @staticmethod
     def check_records():
         try:
-            from core.utils import RECORDS_PATH
-            if not os.path.exists(RECORDS_PATH):
+            from core.storage import get_store
+            if not get_store().exists():
                 return True, "ready for first use"
             return True, "ready"
         except Exception as e:
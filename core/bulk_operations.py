@@ -1,61 +1,60 @@
 # core/bulk_operations.py
 import re
+import itertools
 from datetime import datetime
-from core.database import load_records, save_records, delete_record_by_id
+from core.database import (load_records, iter_records, iter_csv_chunks, scan_records, find_records,
+                           get_records_by_ids, put_records, delete_records, write_lock)
 from core.logger import log
 from core.validators import DataValidator
 
 class BulkOperations:
     
+    @staticmethod
+    def _condition(condition, value):
+        """(field, test) for a condition; matching runs as a scan over that one field"""
+        if condition == 'older_than':
+            try:
+                cutoff = datetime.strptime(value, '%Y-%m-%d')
+            except (TypeError, ValueError):
+                return None, None
+            
+            def older(created):
+                try:
+                    return bool(created) and datetime.strptime(created[:10], '%Y-%m-%d') < cutoff
+                except ValueError:
+                    return False
+            return 'created_at', older
+        if condition in ('national_id', 'phone'):
+            return condition, lambda v: v == value
+        if condition == 'empty_field':
+            return value, lambda v: not v
+        return None, None
+    
     @staticmethod
     def delete_by_condition(condition, value, dry_run=False):
         """
         حذف گروهی بر اساس شرط
         مثال: delete_by_condition('city', 'tehran')
         """
-        records = load_records()
-        to_delete = []
-        kept = []
-        
-        for record in records:
-            match = False
+        # match and delete under one store lock: records other processes add
+        # meanwhile are neither lost nor deleted unseen
+        with write_lock():
             if condition == 'city':
-                if record.get('address', '').lower() == value.lower():
-                    match = True
-            elif condition == 'older_than':
-                try:
-                    cutoff = datetime.strptime(value, '%Y-%m-%d')
-                    created = record.get('created_at', '')
-                    if created:
-                        record_date = datetime.strptime(created[:10], '%Y-%m-%d')
-                        if record_date < cutoff:
-                            match = True
-                except:
-                    pass
-            elif condition == 'national_id':
-                if record.get('national_id') == value:
-                    match = True
-            elif condition == 'phone':
-                if record.get('phone') == value:
-                    match = True
-            elif condition == 'empty_field':
-                if not record.get(value):
-                    match = True
-            
-            if match:
-                to_delete.append(record)
+                # one code comparison per record on the dictionary-encoded column
+                to_delete = find_records('address', value)
             else:
-                kept.append(record)
-        
-        if dry_run:
-            return {
-                'matched': len(to_delete),
-                'records': to_delete
-            }
-        
-        save_records(kept)
-        log(f"BULK_DELETE: deleted {len(to_delete)} records by {condition}={value}")
-        return len(to_delete)
+                field, test = BulkOperations._condition(condition, value)
+                to_delete = scan_records(field, test) if field else []
+            
+            if dry_run:
+                return {
+                    'matched': len(to_delete),
+                    'records': to_delete
+                }
+            
+            deleted = delete_records([r['id'] for r in to_delete])
+        log(f"BULK_DELETE: deleted {deleted} records by {condition}={value}")
+        return deleted
     
     @staticmethod
     def update_by_condition(condition_field, condition_value, updates, dry_run=False):
@@ -63,53 +62,49 @@ class BulkOperations:
         بروزرسانی گروهی
         مثال: update_by_condition('city', 'tehran', {'city': 'karaj', 'add_tag': 'moved'})
         """
-        records = load_records()
+        with write_lock():
+            return BulkOperations._update_locked(condition_field, condition_value, updates, dry_run)
+    
+    @staticmethod
+    def _update_locked(condition_field, condition_value, updates, dry_run):
+        # بررسی شرط
+        if condition_field == 'all':
+            records = load_records()
+        elif condition_field == 'city':
+            records = find_records('address', condition_value)
+        elif condition_field in ('national_id', 'phone'):
+            field, test = BulkOperations._condition(condition_field, condition_value)
+            records = scan_records(field, test)
+        else:
+            records = []
+        
         updated = []
-        unchanged = []
         
         for record in records:
-            match = False
+            # اعمال بروزرسانی‌ها
+            for key, value in updates.items():
+                if key == 'city':
+                    record['address'] = value
+                elif key == 'add_tag':
+                    current_tags = record.get('tags') or ''
+                    if value not in current_tags:
+                        if current_tags:
+                            record['tags'] = f"{current_tags},{value}"
+                        else:
+                            record['tags'] = value
+                elif key == 'remove_tag':
+                    current_tags = (record.get('tags') or '').split(',')
+                    if value in current_tags:
+                        current_tags.remove(value)
+                        record['tags'] = ','.join(current_tags)
+                elif key == 'national_id':
+                    if DataValidator.validate_national_id(value)[0]:
+                        record['national_id'] = value
+                elif key == 'phone':
+                    if DataValidator.validate_iranian_phone(value)[0]:
+                        record['phone'] = value
             
-            # بررسی شرط
-            if condition_field == 'city':
-                if record.get('address', '').lower() == condition_value.lower():
-                    match = True
-            elif condition_field == 'national_id':
-                if record.get('national_id') == condition_value:
-                    match = True
-            elif condition_field == 'phone':
-                if record.get('phone') == condition_value:
-                    match = True
-            elif condition_field == 'all':
-                match = True
-            
-            if match:
-                # اعمال بروزرسانی‌ها
-                for key, value in updates.items():
-                    if key == 'city':
-                        record['address'] = value
-                    elif key == 'add_tag':
-                        current_tags = record.get('tags', '')
-                        if value not in current_tags:
-                            if current_tags:
-                                record['tags'] = f"{current_tags},{value}"
-                            else:
-                                record['tags'] = value
-                    elif key == 'remove_tag':
-                        current_tags = record.get('tags', '').split(',')
-                        if value in current_tags:
-                            current_tags.remove(value)
-                            record['tags'] = ','.join(current_tags)
-                    elif key == 'national_id':
-                        if DataValidator.validate_national_id(value)[0]:
-                            record['national_id'] = value
-                    elif key == 'phone':
-                        if DataValidator.validate_iranian_phone(value)[0]:
-                            record['phone'] = value
-                
-                updated.append(record)
-            else:
-                unchanged.append(record)
+            updated.append(record)
         
         if dry_run:
             return {
@@ -117,7 +112,7 @@ class BulkOperations:
                 'records': updated
             }
         
-        save_records(records)
+        put_records(updated)
         log(f"BULK_UPDATE: updated {len(updated)} records")
         return len(updated)
     
@@ -126,11 +121,10 @@ class BulkOperations:
         """
         خروجی گرفتن از رکوردهای مشخص
         """
-        records = load_records()
-        selected = [r for r in records if r['id'] in record_ids]
+        wanted = set(record_ids)
+        selected = (r for r in iter_records() if r['id'] in wanted)
         
         if format == 'csv':
-            import csv
             import os
             from core.utils import DATA_DIR
             
@@ -138,10 +132,16 @@ class BulkOperations:
             filepath = os.path.join(DATA_DIR, 'exports', filename)
             os.makedirs(os.path.dirname(filepath), exist_ok=True)
             
+            first = next(selected, None)
+            fields = list(first.keys()) if first else []
+            
             with open(filepath, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=selected[0].keys() if selected else [])
-                writer.writeheader()
-                writer.writerows(selected)
+                if first:
+                    rows = itertools.chain([first], selected)
+                    for chunk in iter_csv_chunks(rows, fields):
+                        f.write(chunk)
+                else:
+                    f.write(next(iter_csv_chunks([], fields)))
             
             return filepath
         
@@ -152,14 +152,13 @@ class BulkOperations:
         """
         کپی کردن رکوردها با تغییرات
         """
-        records = load_records()
+        import copy
+        import uuid
+        
         new_records = []
         
-        for record in records:
-            if record['id'] in record_ids:
-                import copy
-                import uuid
-                
+        with write_lock():
+            for record in get_records_by_ids(set(record_ids)):
                 new_record = copy.deepcopy(record)
                 new_record['id'] = str(uuid.uuid4())[:8].upper()
                 new_record['created_at'] = datetime.now().isoformat()
@@ -171,8 +170,7 @@ class BulkOperations:
                             new_record[key] = value
                 
                 new_records.append(new_record)
-        
-        records.extend(new_records)
-        save_records(records)
+            
+            put_records(new_records)
         
         return [r['id'] for r in new_records]
\ No newline at end of file
@@ -0,0 +1,213 @@
+# core/columns.py
+import sys
+from array import array
+from collections.abc import Mapping
+
+# Column-per-field record table for the in-memory record cache. Every field is
+# one list holding that field for all rows (strings interned, so repeated
+# values share a single object) instead of one dict per record. Rows are
+# handed out as read-only dict-like views; scans read the columns directly.
+RECORD_FIELDS = ("id", "first_name", "last_name", "national_id", "dob", "phone",
+                 "address", "tags", "notes", "created_at", "security_score")
+# Low-cardinality fields are dictionary encoded: an array of integer codes
+# into a table of distinct values, plus a case-folded lookup onto those codes.
+# Code 0 is always None.
+ENCODED_FIELDS = ("address",)
+MISSING = object()
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class RecordRow(Mapping):
+    """Read-only view of one table row; dict(row) gives an ordinary record"""
+
+    __slots__ = ("_table", "_i")
+
+    def __init__(self, table, i):
+        self._table = table
+        self._i = i
+
+    def __getitem__(self, key):
+        value = self._table.value(self._i, key)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        value = self._table.value(self._i, key)
+        return default if value is MISSING else value
+
+    def __iter__(self):
+        return iter(self._table.keys(self._i))
+
+    def __len__(self):
+        return len(self._table.keys(self._i))
+
+    def __repr__(self):
+        return repr(self._table.to_dict(self._i))
+
+
+class EncodedColumn:
+    """Dictionary-encoded column: codes[i] indexes values"""
+
+    def __init__(self):
+        self.codes = array("I")
+        self.values = [None]
+        self.lookup = {None: 0}
+        self.folded = {}
+
+    def copy(self):
+        column = EncodedColumn()
+        column.codes = array("I", self.codes)
+        column.values = list(self.values)
+        column.lookup = dict(self.lookup)
+        column.folded = {key: list(codes) for key, codes in self.folded.items()}
+        return column
+
+    def encode(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = self.lookup[value] = len(self.values)
+            self.values.append(value)
+            self.folded.setdefault(str(value).lower(), []).append(code)
+        return code
+
+    def codes_for(self, text):
+        """Codes of every value equal to text ignoring case"""
+        if not text:
+            return [0] + self.folded.get("", [])
+        return self.folded.get(text.lower(), [])
+
+
+class RecordTable:
+    """Records stored as columns. Once other readers can see a table, rows are
+    only appended to it in place (a row counts once it is complete); replacing
+    or dropping rows works on a copy."""
+
+    def __init__(self, fields=RECORD_FIELDS, encoded=ENCODED_FIELDS):
+        self.fields = tuple(fields)
+        self.columns = {field: [] for field in self.fields if field not in encoded}
+        self.encoded = {field: EncodedColumn() for field in self.fields if field in encoded}
+        # rows lacking one of the fields (stored as None), and keys outside them
+        self.absent = {}
+        self.extras = {}
+        self.size = 0
+
+    @classmethod
+    def from_records(cls, records, fields=RECORD_FIELDS):
+        table = cls(fields)
+        for record in records:
+            table.append(record)
+        return table
+
+    def _empty_copy(self):
+        table = RecordTable(self.fields, ())
+        table.columns = {}
+        table.encoded = {}
+        return table
+
+    def copy(self):
+        table = self._empty_copy()
+        table.columns = {field: list(column) for field, column in self.columns.items()}
+        table.encoded = {field: column.copy() for field, column in self.encoded.items()}
+        table.absent = {field: set(rows) for field, rows in self.absent.items()}
+        table.extras = {i: dict(extra) for i, extra in self.extras.items()}
+        table.size = self.size
+        return table
+
+    def _store(self, i, record):
+        for field in self.fields:
+            value = record.get(field, MISSING)
+            if value is MISSING:
+                self.absent.setdefault(field, set()).add(i)
+                value = None
+            else:
+                rows = self.absent.get(field)
+                if rows:
+                    rows.discard(i)
+            value = _intern(value)
+            if field in self.encoded:
+                self.encoded[field].codes[i] = self.encoded[field].encode(value)
+            else:
+                self.columns[field][i] = value
+        extra = {key: _intern(value) for key, value in record.items() if key not in self.fields}
+        if extra:
+            self.extras[i] = extra
+        else:
+            self.extras.pop(i, None)
+
+    def append(self, record):
+        for column in self.columns.values():
+            column.append(None)
+        for column in self.encoded.values():
+            column.codes.append(0)
+        self._store(self.size, record)
+        self.size += 1
+
+    def set(self, i, record):
+        self._store(i, record)
+
+    def without(self, positions):
+        """New table with the given row positions dropped"""
+        keep = [i for i in range(self.size) if i not in positions]
+        moved = {old: new for new, old in enumerate(keep)}
+        table = self._empty_copy()
+        table.columns = {field: [column[i] for i in keep] for field, column in self.columns.items()}
+        for field, column in self.encoded.items():
+            table.encoded[field] = encoded = column.copy()
+            encoded.codes = array("I", [column.codes[i] for i in keep])
+        table.absent = {field: {moved[i] for i in rows if i in moved} for field, rows in self.absent.items()}
+        table.extras = {moved[i]: extra for i, extra in self.extras.items() if i in moved}
+        table.size = len(keep)
+        return table
+
+    def value(self, i, field):
+        column = self.columns.get(field)
+        if column is not None:
+            value = column[i]
+        elif field in self.encoded:
+            encoded = self.encoded[field]
+            value = encoded.values[encoded.codes[i]]
+        else:
+            extra = self.extras.get(i)
+            return extra.get(field, MISSING) if extra else MISSING
+        if value is None and i in self.absent.get(field, ()):
+            return MISSING
+        return value
+
+    def keys(self, i):
+        keys = [field for field in self.fields if i not in self.absent.get(field, ())]
+        extra = self.extras.get(i)
+        if extra:
+            keys.extend(extra)
+        return keys
+
+    def to_dict(self, i):
+        return {key: self.value(i, key) for key in self.keys(i)}
+
+    def column(self, field):
+        """All values of a field in row order (None where unset); read-only"""
+        column = self.columns.get(field)
+        if column is not None:
+            return column
+        if field in self.encoded:
+            values = self.encoded[field].values
+            return [values[code] for code in self.encoded[field].codes]
+        return [self.extras.get(i, {}).get(field) for i in range(self.size)]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return (RecordRow(self, i) for i in range(self.size))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [RecordRow(self, n) for n in range(*i.indices(self.size))]
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError("record table index out of range")
+        return RecordRow(self, i)
@@ -16,7 +16,7 @@ COMMAND_CATEGORIES = {
     },
     "export": {
         "name": "Export & Reports",
-        "commands": ["export", "report", "stats"],
+        "commands": ["export", "import", "report", "stats"],
         "description": "Export data and generate reports"
     },
     "utility": {
@@ -1,7 +1,7 @@
 from core.argument_parser import (
     handle_useradd_arguments, handle_userdel_arguments, handle_usermod_arguments,
     handle_add_arguments, handle_delete_arguments, handle_view_arguments,
-    handle_search_arguments, handle_export_arguments, show_command_help,
+    handle_search_arguments, handle_export_arguments, handle_import_arguments, show_command_help,
     handle_useredit_arguments
 )
 from core.database import (
@@ -9,23 +9,28 @@ from core.database import (
     load_records, save_records, validate_iranian_phone, format_iranian_phone, 
     validate_national_id, is_duplicate_record, delete_record_by_id, capitalize_name,
     show_exports_location, get_system_stats, advanced_search, get_available_backups,
-    restore_from_backup, get_last_backup_info
+    restore_from_backup, get_last_backup_info, update_record, get_records_count,
+    iter_records, add_records_batch, read_import_rows, write_lock
 )
-from core.auth import verify, load_users, save_users
+from core.auth import attempt_login, hash_password, load_users, edit_users
+from core.login_throttle import LoginBusy
+from datetime import datetime, timedelta
 from threading import Thread, Event
 from cryptography.fernet import Fernet
 from core.progress import animated_login, loading_operation
 from core.progress import simple_loading
 from core.argument_parser import handle_add_arguments, show_command_help
 from core.clear import clear_screen
-from core.logger import log
+from core.logger import log, log_event, flush_logs
+from core.log_archive import iter_log_lines, recent_lines, follow_log
+from core.log_events import query_events, event_lines
 from core.utils import VERSION, LOG_PATH, USERS_PATH
 from core.validators import DataValidator
 from tabulate import tabulate
 import getpass
+import itertools
 import os
 import sys
-import bcrypt
 import json
 import time
 import psutil
@@ -34,12 +39,12 @@ last_activity_time = time.time()
 logout_timer_event = Event()
 
 ACCESS = {
-    "root": {"add", "search", "view", "export", "backup", "help", "clear", "whoami", "exit", 
+    "root": {"add", "import", "search", "view", "export", "backup", "help", "clear", "whoami", "exit", 
              "useradd", "userdel", "usermod", "logs", "config", "edit", "delete", "lists", 
              "userlist", "stats", "restore", "autobackup", "useredit"},
-    "admin": {"add", "search", "view", "export", "backup", "help", "clear", "whoami", "exit", 
+    "admin": {"add", "import", "search", "view", "export", "backup", "help", "clear", "whoami", "exit", 
               "logs", "edit", "delete", "lists", "userlist", "stats"},
-    "staff": {"add", "search", "view", "export", "help", "clear", "whoami", "exit", "lists", "stats"},
+    "staff": {"add", "import", "search", "view", "export", "help", "clear", "whoami", "exit", "lists", "stats"},
     "viewer": {"search", "view", "help", "clear", "whoami", "exit", "lists", "stats"}
 }
 
@@ -53,6 +58,7 @@ COMMANDS = {
     "search": {"roles": {"root", "admin", "staff", "viewer"}, "desc": "Search records with advanced options"},
     "view": {"roles": {"root", "admin", "staff", "viewer"}, "desc": "View one record"},
     "export": {"roles": {"root", "admin", "staff"}, "desc": "Export all to CSV"},
+    "import": {"roles": {"root", "admin", "staff"}, "desc": "Import records from CSV or JSON"},
     "backup": {"roles": {"root", "admin"}, "desc": "Create backup"},
     "edit": {"roles": {"root", "admin"}, "desc": "Edit existing record"},
     "delete": {"roles": {"root", "admin"}, "desc": "Delete record"},
@@ -60,7 +66,7 @@ COMMANDS = {
     "userdel": {"roles": {"root"}, "desc": "Delete user"},
     "usermod": {"roles": {"root"}, "desc": "Modify user role"},
     "useredit": {"roles": {"root"}, "desc": "Edit user username or password"},
-    "logs": {"roles": {"root", "admin"}, "desc": "View system logs"},
+    "logs": {"roles": {"root", "admin"}, "desc": "View system logs (logs -f to follow)"},
     "config": {"roles": {"root"}, "desc": "System configuration"},
     "lists": {"roles": {"root", "admin", "staff", "viewer"}, "desc": "List all records with pagination"},
     "userlist": {"roles": {"root", "admin"}, "desc": "List all system users"},
@@ -217,6 +223,8 @@ def auto_logout_monitor():
         if check_session_timeout():
             print("\n\nSession timeout: You have been logged out due to inactivity.")
             print("Please login again.\n")
+            # os._exit skips atexit, so drain queued log lines first
+            flush_logs()
             os._exit(0)  
 
 def safe_input(prompt):
@@ -254,8 +262,15 @@ def run_project_shell():
             print("\nLogin cancelled")
             return
         
-        user_info = verify(username, password)
-        if not user_info:
+        try:
+            user_info, retry_after = attempt_login(username, password, "local")
+        except LoginBusy:
+            print("Server is busy. Please try again in a moment.")
+            continue
+        if retry_after:
+            attempts += 1
+            print(f"Too many login attempts. Try again in {int(retry_after) + 1} seconds.")
+        elif not user_info:
             attempts += 1
             print("Login failed. Please try again.")
     
@@ -468,6 +483,12 @@ def repl(role, user):
         if base == "bulk":
             do_bulk(role, user, parts)
             continue
+        if base == "import":
+            try:
+                do_import(role, user, parts)
+            except KeyboardInterrupt:
+                print("\nImport cancelled")
+            continue
 
         if base == "joke":
             do_joke()
@@ -856,8 +877,7 @@ def repl(role, user):
                 exports_dir = show_exports_location()
                 print(f"Exports will be saved to: {exports_dir}")
                 
-                records = load_records()
-                record_count = len(records)
+                record_count = get_records_count()
                 
                 if record_count == 0:
                     print("No records to export")
@@ -889,7 +909,7 @@ def repl(role, user):
                     
                     if count > 0:
                         print(f"\nFirst 3 records exported:")
-                        sample_records = records[:3]
+                        sample_records = list(itertools.islice(iter_records(), 3))
                         for i, rec in enumerate(sample_records, 1):
                             print(f"  {i}. {rec.get('first_name', '')} {rec.get('last_name', '')} - {rec.get('phone', '')}")
                         if count > 3:
@@ -1129,7 +1149,10 @@ def repl(role, user):
         # ==================== LOGS COMMAND ====================
         if base == "logs":
             try:
-                do_advanced_logs(role, user)
+                if len(parts) > 1 and parts[1] in ("-f", "--follow"):
+                    do_follow_logs(role)
+                else:
+                    do_advanced_logs(role, user)
             except KeyboardInterrupt:
                 print("\nLogs cancelled")
             continue
@@ -1163,6 +1186,13 @@ def repl(role, user):
                     print("\nUsers by Role:")
                     for role, count in report['users_by_role'].items():
                         print(f"  {role}: {count} user(s)")
+                    print("\nActivity (last 7 days):")
+                    if report['recent_activity']:
+                        rows = [[name, a['events'], a['logins'], a['failed_logins'], a['last_seen']]
+                                for name, a in sorted(report['recent_activity'].items())]
+                        print(tabulate(rows, headers=["User", "Events", "Logins", "Failed", "Last seen"], tablefmt="grid"))
+                    else:
+                        print("  No activity recorded")
                     
                 elif report_type == "2":
                     report = Analytics.data_quality_report()
@@ -1197,6 +1227,11 @@ def repl(role, user):
                     print("Recent Activity:")
                     for activity, count in report['recent_activity'].items():
                         print(f"  {activity}: {count}")
+                    active_hours = [t for t in report.get('security_trend', []) if t['failed_logins'] or t['security_events']]
+                    if active_hours:
+                        print("\nHourly trend (last 24h, UTC):")
+                        rows = [[t['hour'], t['failed_logins'], t['security_events']] for t in active_hours]
+                        print(tabulate(rows, headers=["Hour", "Failed logins", "Security events"], tablefmt="grid"))
                     if report['recommendations']:
                         print("\nRecommendations:")
                         for rec in report['recommendations']:
@@ -1406,7 +1441,23 @@ def repl(role, user):
             if role != "root":
                 print("Access denied. Only root can modify configuration.")
                 continue
+            if len(parts) > 1 and parts[1] == "rotate-key":
+                from core.config_manager import rotate_encryption_key
+                confirm = safe_input("Rotate the encryption key and re-encrypt all data? (y/N): ")
+                if not confirm or confirm.lower() not in ['y', 'yes']:
+                    print("Key rotation cancelled")
+                    continue
+                if rotate_encryption_key():
+                    # rewrite live data under the new key; backups stay readable via the retired key
+                    with edit_users():
+                        pass
+                    with write_lock():
+                        save_records(load_records())
+                    log_event("CONFIG", "rotated encryption key", user=user)
+                    print("Encryption key rotated")
+                continue
             print("Configuration system - coming soon!")
+            print("  config rotate-key    - Rotate the encryption key")
             continue
 
 def do_help(role, category=None):
@@ -1473,6 +1524,7 @@ def handle_webpanel(args):
     import signal
     import time
     import socket
+    from core.config_manager import get_web_config
     
     # ========== محدودیت‌های پورت ==========
     PORT_MIN = 1024
@@ -1584,6 +1636,9 @@ def handle_webpanel(args):
     stop = False
     status = False
     force = False
+    reload = False
+    workers = None
+    threads = None
     
     # ========== پردازش آرگومان‌ها ==========
     i = 0
@@ -1616,6 +1671,22 @@ def handle_webpanel(args):
         elif args[i] == '--debug':
             debug = True
             i += 1
+        elif args[i] in ('--workers', '--threads') and i + 1 < len(args):
+            try:
+                count = int(args[i + 1])
+            except ValueError:
+                count = 0
+            if not 1 <= count <= 64:
+                print(f" {args[i]} must be a number between 1 and 64")
+                return
+            if args[i] == '--workers':
+                workers = count
+            else:
+                threads = count
+            i += 2
+        elif args[i] == '--reload':
+            reload = True
+            i += 1
         elif args[i] == '--stop':
             stop = True
             i += 1
@@ -1658,6 +1729,22 @@ def handle_webpanel(args):
             print(" No web panel is running")
         return
     
+    if reload:
+        running, message = is_another_instance_running()
+        if not running or not os.path.exists(pid_file):
+            print(" No running web panel found")
+        elif os.name == 'nt':
+            print(" Graceful reload is not available on Windows; use --stop and start again")
+        else:
+            with open(pid_file, 'r') as f:
+                pid = f.read().strip()
+            try:
+                os.kill(int(pid), signal.SIGHUP)
+                print(f" Reloading web panel (PID: {pid}): fresh workers take over, running requests finish")
+            except Exception as e:
+                print(f" Failed to reload: {e}")
+        return
+    
     if stop:
         running, message = is_another_instance_running()
         if running:
@@ -1672,16 +1759,16 @@ def handle_webpanel(args):
                         import psutil
                         process = psutil.Process(int(pid))
                     
-                        # kill all child processes first
                         children = process.children(recursive=True)
-                        for child in children:
-                            child.kill()
                     
-                        # kill main process
-                        process.kill()
+                        # ask the server to stop: workers finish their requests first
+                        process.terminate()
+                        gone, alive = psutil.wait_procs([process] + children, timeout=15)
                     
-                        # wait for process to terminate
-                        gone, alive = psutil.wait_procs([process], timeout=5)
+                        # whatever is still running gets killed
+                        for leftover in alive:
+                            leftover.kill()
+                        psutil.wait_procs(alive, timeout=5)
                     
                         print(f" Process terminated")
                     
@@ -1746,8 +1833,10 @@ def handle_webpanel(args):
                     print(f"   • {p} (available)")
         return
     
-    # مسیر فایل web app
-    web_app_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'web', 'app.py')
+    # مسیر فایل web app: debug uses Flask's development server, otherwise the
+    # multi-worker production server
+    web_app_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'web',
+                                'app.py' if debug else 'server.py')
     
     if not os.path.exists(web_app_path):
         print(" Web panel files not found!")
@@ -1760,6 +1849,10 @@ def handle_webpanel(args):
     
     if debug:
         env['FLASK_DEBUG'] = '1'
+    if workers:
+        env['DATANA_WORKERS'] = str(workers)
+    if threads:
+        env['DATANA_THREADS'] = str(threads)
     
     # اجرا
     try:
@@ -1795,8 +1888,13 @@ def handle_webpanel(args):
                 print(f"   URL: http://localhost:{port}")
                 print(f"   PID: {process.pid}")
                 print(f"   Debug mode: {'ON' if debug else 'OFF'}")
+                if not debug:
+                    web_config = get_web_config()
+                    print(f"   Workers: {workers or web_config['workers']} x {threads or web_config['threads']} threads")
                 print(f"\n Log file: {log_file}")
                 print("\nUse 'run webpanel --stop' to stop the server")
+                if not debug and os.name != 'nt':
+                    print("Use 'run webpanel --reload' to restart the workers gracefully")
                 print("Use 'run webpanel --status' to check status")
             else:
                 print(" Web panel failed to start properly")
@@ -1848,6 +1946,8 @@ def show_port_help():
     print("   run webpanel -p 5000     # Default")
     print("   run webpanel -p 8080     # Alternative")
     print("   run webpanel -p 8001 --debug")
+    print("   run webpanel -p 5000 --workers 4 --threads 8")
+    print("   run webpanel --reload    # Restart workers gracefully")
     print("="*60)
 
 def do_bulk(role, current_user, parts):
@@ -1867,6 +1967,57 @@ def do_bulk(role, current_user, parts):
         print("  --confirm     - Skip confirmation")
         return
 
+def do_import(role, current_user, parts):
+    if len(parts) < 2 or parts[1] == '--help':
+        show_command_help('import')
+        return
+    
+    args = handle_import_arguments(parts)
+    if not args:
+        return
+    
+    path = args['filename']
+    if not os.path.exists(path):
+        print(f"File not found: {path}")
+        return
+    
+    format = "json" if path.lower().endswith(".json") else "csv"
+    print(f"Importing {format.upper()} file: {path}")
+    
+    if not args.get('auto_confirm'):
+        confirm = safe_input("Proceed with import? (Y/n): ")
+        if confirm == "CANCEL" or (confirm and confirm.lower() in ['n', 'no']):
+            print("Import cancelled")
+            return
+    
+    try:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            added, errors = add_records_batch(read_import_rows(f, format))
+    except (ValueError, json.JSONDecodeError) as e:
+        print(f"Import failed: {e}")
+        return
+    
+    print(f"\nImport finished: {len(added)} added, {len(errors)} rejected")
+    for row, message in errors[:20]:
+        print(f"  Row {row}: {message}")
+    if len(errors) > 20:
+        print(f"  ... and {len(errors) - 20} more errors")
+
+def do_follow_logs(role):
+    if role not in ["root", "admin"]:
+        print("Access denied. Only root and admin can view logs.")
+        return
+    
+    print("Following logs (Ctrl+C to stop)")
+    print("=" * 80)
+    for line in recent_lines(10):
+        print(line.rstrip())
+    try:
+        for line in follow_log():
+            print(line.rstrip())
+    except KeyboardInterrupt:
+        print("\nStopped following logs")
+
 def do_advanced_logs(role, current_user):
     if role not in ["root", "admin"]:
         print("Access denied. Only root and admin can view logs.")
@@ -1882,25 +2033,42 @@ def do_advanced_logs(role, current_user):
         print("  2. View logs for specific user")
         print("  3. Search in logs")
         print("  4. View recent logs (last 50 lines)")
+        print("  5. View logs by event type")
         
-        choice = safe_input("Select option (1-4): ")
+        choice = safe_input("Select option (1-5): ")
         if choice is None: return
         
         loading_operation("LOADING LOGS", 0.5)
         
-        with open(LOG_PATH, "r", encoding="utf-8") as f:
-            logs = f.readlines()
-        
+        # archives are streamed, and skipped entirely when their index rules them out;
+        # user and event type filters are answered from the event index
         if choice == "2":
             username = safe_input("Enter username to filter: ")
+            if username is None: return
+            event_types = (safe_input("Event types (comma separated, blank for all): ") or "").upper()
+            event_types = {e.strip() for e in event_types.split(",") if e.strip()}
+            days = safe_input("Only the last N days (blank for all): ")
+            since = None
+            if days and days.strip().isdigit():
+                since = (datetime.utcnow() - timedelta(days=int(days))).isoformat(sep=" ", timespec="seconds")
             if username:
-                logs = [log for log in logs if f"user={username}" in log]
+                logs = event_lines(query_events(event_types=event_types or None, user=username, since=since))
+            else:
+                logs = list(iter_log_lines(since=since, event_types=event_types or None))
         elif choice == "3":
-            search_term = safe_input("Enter search term: ")
-            if search_term:
-                logs = [log for log in logs if search_term.lower() in log.lower()]
+            search_term = (safe_input("Enter search term: ") or "").lower()
+            logs = [log for log in iter_log_lines() if search_term in log.lower()]
         elif choice == "4":
-            logs = logs[-50:]
+            logs = recent_lines(50)
+        elif choice == "5":
+            event_types = (safe_input("Event types (comma separated, e.g. LOGIN_FAIL,DELETE): ") or "").upper()
+            event_types = {e.strip() for e in event_types.split(",") if e.strip()}
+            if event_types:
+                logs = event_lines(query_events(event_types=event_types))
+            else:
+                logs = list(iter_log_lines())
+        else:
+            logs = list(iter_log_lines())
         
         if not logs:
             print("No logs found matching your criteria.")
@@ -1930,13 +2098,7 @@ def do_edit(role, current_user):
         print("\nEdit cancelled")
         return
     
-    records = load_records()
-    
-    record = None
-    for r in records:
-        if r["id"] == record_id:
-            record = r
-            break
+    record = search_by_id(record_id)
     
     if not record:
         print("Record not found.")
@@ -2006,8 +2168,10 @@ def do_edit(role, current_user):
         print("\nEdit cancelled")
         return
         
-    save_records(records)
-    log(f"EDIT: {current_user} edited record={record_id}")
+    if not update_record(record):
+        print(f"Record {record_id} not found.")
+        return
+    log_event("EDIT", "edited record", user=current_user, record_id=record_id)
     print("Record updated successfully.")
 
 def do_delete_direct(role, current_user, record_id):
@@ -2021,13 +2185,7 @@ def do_delete_direct(role, current_user, record_id):
         print("\nDelete cancelled")
         return
     
-    records = load_records()
-    
-    record_to_delete = None
-    for r in records:
-        if r["id"] == record_id:
-            record_to_delete = r
-            break
+    record_to_delete = search_by_id(record_id)
     
     if not record_to_delete:
         print(f"Record {record_id} not found.")
@@ -2051,9 +2209,8 @@ def do_delete_direct(role, current_user, record_id):
         print("\nDelete cancelled")
         return
     
-    new_records = [r for r in records if r["id"] != record_id]
-    save_records(new_records)
-    log(f"DELETE: {current_user} deleted record={record_id}")
+    delete_record_by_id(record_id)
+    log_event("DELETE", "deleted record", user=current_user, record_id=record_id)
     print(f"Record {record_id} deleted successfully.")
 
 def do_profile(username):
@@ -2103,13 +2260,7 @@ def do_delete(role, current_user):
         print("\nDelete cancelled")
         return
     
-    records = load_records()
-    
-    record_to_delete = None
-    for r in records:
-        if r["id"] == record_id:
-            record_to_delete = r
-            break
+    record_to_delete = search_by_id(record_id)
     
     if not record_to_delete:
         print("Record not found.")
@@ -2133,9 +2284,8 @@ def do_delete(role, current_user):
         print("\nDelete cancelled")
         return
     
-    new_records = [r for r in records if r["id"] != record_id]
-    save_records(new_records)
-    log(f"DELETE: {current_user} deleted record={record_id}")
+    delete_record_by_id(record_id)
+    log_event("DELETE", "deleted record", user=current_user, record_id=record_id)
     print("Record deleted successfully.")
 
 def do_useradd(role, current_user, username, password, user_role, auto_confirm=False):
@@ -2168,11 +2318,14 @@ def do_useradd(role, current_user, username, password, user_role, auto_confirm=F
         print("\nUser add cancelled")
         return
     
-    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-    users[username] = {"username": username, "password": hashed, "role": user_role}
+    hashed = hash_password(password)
+    with edit_users() as users:
+        if username in users:
+            print("User already exists.")
+            return
+        users[username] = {"username": username, "password": hashed, "role": user_role}
     
-    save_users(users)
-    log(f"USERADD: {current_user} added user={username} role={user_role}")
+    log_event("USERADD", f"added {username} role={user_role}", user=current_user)
     print(f"User {username} added successfully.")
 
 def do_userdel(role, current_user, username, auto_confirm=False):
@@ -2213,9 +2366,9 @@ def do_userdel(role, current_user, username, auto_confirm=False):
         print("\nUser delete cancelled")
         return
     
-    del users[username]
-    save_users(users)
-    log(f"USERDEL: {current_user} deleted user={username}")
+    with edit_users() as users:
+        users.pop(username, None)
+    log_event("USERDEL", f"deleted {username}", user=current_user)
     print(f"User {username} deleted successfully.")
 
 def do_usermod(role, current_user, username, new_role, auto_confirm=False):
@@ -2248,9 +2401,12 @@ def do_usermod(role, current_user, username, new_role, auto_confirm=False):
         print("\nUser modify cancelled")
         return
     
-    users[username]["role"] = new_role
-    save_users(users)
-    log(f"USERMOD: {current_user} modified user={username} role={new_role}")
+    with edit_users() as users:
+        if username not in users:
+            print("User not found.")
+            return
+        users[username]["role"] = new_role
+    log_event("USERMOD", f"modified {username} role={new_role}", user=current_user)
     print(f"User {username} role changed to {new_role}.")
 
 def do_useredit(role, current_user, username, new_password=None, new_username=None, auto_confirm=False):
@@ -2293,25 +2449,31 @@ def do_useredit(role, current_user, username, new_password=None, new_username=No
         print("\nUser edit cancelled")
         return
 
-    if new_username and new_username.strip():
-        if new_username in users:
-            print(f"Error: Username {new_username} already exists.")
+    new_hashed = None
+    if new_password and new_password.strip():
+        new_hashed = hash_password(new_password)
+    
+    with edit_users() as users:
+        if username not in users:
+            print("User not found.")
             return
         
-        users[new_username] = users[username]
-        users[new_username]['username'] = new_username
-        del users[username]
-        username = new_username  
-        print(f"Username changed to {new_username}")
-    
-    if new_password and new_password.strip():
-
-        new_hashed = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
-        users[username]["password"] = new_hashed
-        print("Password changed successfully")
+        if new_username and new_username.strip():
+            if new_username in users:
+                print(f"Error: Username {new_username} already exists.")
+                return
+            
+            users[new_username] = users[username]
+            users[new_username]['username'] = new_username
+            del users[username]
+            username = new_username  
+            print(f"Username changed to {new_username}")
+        
+        if new_hashed:
+            users[username]["password"] = new_hashed
+            print("Password changed successfully")
     
-    save_users(users)
-    log(f"USEREDIT: {current_user} edited user={username} changes={changes}")
+    log_event("USEREDIT", f"edited {username} changes={changes}", user=current_user)
     print(f"User {username} updated successfully.")
 
 def do_userlist(role, current_user):
@@ -2508,7 +2670,7 @@ def do_lists(role, current_user):
                             loading_operation("DELETING RECORD", 1.0)
                             success = delete_record_by_id(record_id)
                             if success:
-                                log(f"DELETE: {current_user} deleted record={record_id}")
+                                log_event("DELETE", "deleted record", user=current_user, record_id=record_id)
                                 print(f"Record {record_id} deleted successfully.")
                                 records = load_records()
                                 record_count = len(records)
@@ -1,19 +1,96 @@
 # core/config_manager.py
 import os
+import hmac
 import json
-from cryptography.fernet import Fernet
+import hashlib
+import time
+import secrets
+import threading
+from cryptography.fernet import Fernet, MultiFernet
 from core.utils import DATA_DIR
+from core.file_lock import lock_for, atomic_write
 
 CONFIG_FILE = os.path.join(DATA_DIR, "datana_config.json")
 
+# fsync: "always" after every batch, "interval" at most every fsync_interval
+# seconds, "never" to leave flushing to the OS. logs.txt is archived once it
+# reaches rotate_mb or its first entry is rotate_days old.
+DEFAULT_LOGGING = {
+    "fsync": "interval",
+    "fsync_interval": 1.0,
+    "rotate_mb": 5,
+    "rotate_days": 7
+}
+
+# columnar: keep the in-memory record cache as one column per field instead
+# of one dict per record; worth it for large stores.
+DEFAULT_CACHE = {
+    "columnar": False
+}
+
+# Production web server (web/server.py): worker processes, request threads
+# per worker, and how long a stopping worker may finish its requests.
+# session_store: "cookie" keeps the session in a signed cookie, "sqlite" keeps
+# it in data/sessions.db and the cookie only carries its signed id; idle
+# server-side sessions expire after session_hours.
+DEFAULT_WEB = {
+    "workers": 4,
+    "threads": 8,
+    "graceful_timeout": 30,
+    "session_store": "cookie",
+    "session_hours": 12
+}
+
+# Logins: every username and every client address may try user_attempts /
+# ip_attempts logins per window_seconds (token buckets, kept per process).
+# Password checks run on check_threads threads. Passwords are hashed with
+# bcrypt_rounds; older hashes are upgraded at their next successful login.
+DEFAULT_AUTH = {
+    "bcrypt_rounds": 12,
+    "user_attempts": 5,
+    "ip_attempts": 20,
+    "window_seconds": 60,
+    "check_threads": 2
+}
+
+# Key material is parsed once per process and kept until the config file
+# changes on disk (stat check) or the key is rotated.
+_key_lock = threading.Lock()
+_key_state = {
+    "stat": None,
+    "key": None,
+    "retired": (),
+    "fernet": None,
+    "log_mac": None,
+    "rotated_at": None,
+    "session_hours": DEFAULT_WEB["session_hours"]
+}
+
+def _read_config():
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        # never replace it: its key is the only way to decrypt the data
+        raise RuntimeError(f"Config file {CONFIG_FILE} is unreadable: {e}")
+
+def _write_config(config):
+    # caller holds lock_for(CONFIG_FILE) exclusively
+    atomic_write(CONFIG_FILE, json.dumps(config, indent=2))
+
 def get_or_create_config():
     os.makedirs(DATA_DIR, exist_ok=True)
     
+    # writers replace the file atomically, so reading needs no lock
     if os.path.exists(CONFIG_FILE):
-        try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                
+        config = _read_config()
+        if "autobackup" in config and "LOG_MAC_KEY" in config:
+            return config
+    
+    with lock_for(CONFIG_FILE).exclusive():
+        if os.path.exists(CONFIG_FILE):
+            config = _read_config()
+            
             # اگر config قدیمی هست، فیلد autobackup رو اضافه کن
             if "autobackup" not in config:
                 config["autobackup"] = {
@@ -21,71 +98,161 @@ def get_or_create_config():
                     "mode": "daily",
                     "last_backup": None
                 }
-                # ذخیره config آپدیت شده
-                with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-                    json.dump(config, f, indent=2)
-                    
+            
+            if "LOG_MAC_KEY" not in config:
+                # logs so far were sealed with the data key: keep verifying them
+                config["LOG_MAC_KEY"] = config["DATANA_KEY"]
+            
+            # ذخیره config آپدیت شده
+            _write_config(config)
             return config
-        except:
-            pass
-    #End to End Encrypt
-    new_key = Fernet.generate_key().decode()
-    config = {
-        "DATANA_KEY": new_key,
-        "version": "1.0.0",
-        "auto_generated": True,
-        "autobackup": {
-            "enabled": False,
-            "mode": "daily",
-            "last_backup": None
+        
+        #End to End Encrypt
+        new_key = Fernet.generate_key().decode()
+        config = {
+            "DATANA_KEY": new_key,
+            # seals the log's HMAC chain; unlike DATANA_KEY it is never rotated
+            "LOG_MAC_KEY": secrets.token_hex(32),
+            "version": "1.0.0",
+            "auto_generated": True,
+            "autobackup": {
+                "enabled": False,
+                "mode": "daily",
+                "last_backup": None
+            },
+            "logging": dict(DEFAULT_LOGGING),
+            "cache": dict(DEFAULT_CACHE),
+            "web": dict(DEFAULT_WEB),
+            "auth": dict(DEFAULT_AUTH)
         }
-    }
-    
+        
+        try:
+            _write_config(config)
+        except Exception as e:
+            print(f"Could not save config: {e}")
+        
+        return config
+
+def _config_stat():
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2)
-    except Exception as e:
-        print(f"Could not save config: {e}")
-    
-    return config
+        st = os.stat(CONFIG_FILE)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+def _current_key():
+    with _key_lock:
+        stat = _config_stat()
+        if _key_state["key"] is None or stat != _key_state["stat"]:
+            config = get_or_create_config()
+            key = config["DATANA_KEY"].encode()
+            _key_state["log_mac"] = config["LOG_MAC_KEY"].encode()
+            _key_state["rotated_at"] = config.get("DATANA_KEY_ROTATED_AT")
+            _key_state["session_hours"] = config.get("web", {}).get("session_hours", DEFAULT_WEB["session_hours"])
+            retired = tuple(k.encode() for k in config.get("DATANA_OLD_KEYS", []))
+            if key != _key_state["key"] or retired != _key_state["retired"]:
+                # encrypts with the current key, still decrypts data from retired ones
+                _key_state["fernet"] = MultiFernet([Fernet(k) for k in (key,) + retired])
+                _key_state["key"], _key_state["retired"] = key, retired
+            _key_state["stat"] = _config_stat()
+        return _key_state["key"], _key_state["fernet"]
 
 def get_encryption_key():
-    config = get_or_create_config()
-    return config["DATANA_KEY"].encode()
+    return _current_key()[0]
+
+def get_log_mac_key():
+    """Key of the log's HMAC chain; stays the same across rotate-key"""
+    _current_key()
+    return _key_state["log_mac"]
+
+def get_fernet():
+    return _current_key()[1]
+
+def get_session_keys():
+    """Web session signing keys, oldest first and the current one last. They are
+    derived from the Datana keys, so every worker and every restart agrees on
+    them. Only the key retired by the latest rotation still verifies, and only
+    for session_hours after it, so rotating a leaked key ends its sessions."""
+    key, _ = _current_key()
+    with _key_lock:
+        retired, rotated_at = _key_state["retired"], _key_state["rotated_at"]
+        hours = _key_state["session_hours"]
+    keys = (key,)
+    if retired and rotated_at and time.time() - rotated_at < hours * 3600:
+        keys = (retired[0], key)
+    return [hmac.new(k, b"datana web session", hashlib.sha256).hexdigest() for k in keys]
+
+def reload_encryption_key():
+    with _key_lock:
+        _key_state["key"] = None
+    return get_encryption_key()
+
+def rotate_encryption_key():
+    """Make a fresh key current; the old one is kept for decrypting existing data"""
+    with lock_for(CONFIG_FILE).exclusive():
+        config = get_or_create_config()
+        old_key = config["DATANA_KEY"]
+        config["DATANA_KEY"] = Fernet.generate_key().decode()
+        config["DATANA_OLD_KEYS"] = [old_key] + config.get("DATANA_OLD_KEYS", [])
+        config["DATANA_KEY_ROTATED_AT"] = time.time()
+        
+        try:
+            _write_config(config)
+        except Exception as e:
+            print(f"Error rotating key: {e}")
+            return None
+    
+    return reload_encryption_key()
 
 def show_key_info():
     config = get_or_create_config()
     return config["DATANA_KEY"]
 
 def update_autobackup_config(enabled=None, mode=None):
-    config = get_or_create_config()
-    
-    if enabled is not None:
-        config["autobackup"]["enabled"] = enabled
-    if mode is not None:
-        config["autobackup"]["mode"] = mode
-    
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error updating config: {e}")
-        return False
+    with lock_for(CONFIG_FILE).exclusive():
+        config = get_or_create_config()
+        
+        if enabled is not None:
+            config["autobackup"]["enabled"] = enabled
+        if mode is not None:
+            config["autobackup"]["mode"] = mode
+        
+        try:
+            _write_config(config)
+            return True
+        except Exception as e:
+            print(f"Error updating config: {e}")
+            return False
 
 def get_autobackup_config():
     config = get_or_create_config()
     return config["autobackup"]
 
+def get_logging_config():
+    config = get_or_create_config()
+    return {**DEFAULT_LOGGING, **config.get("logging", {})}
+
+def get_cache_config():
+    config = get_or_create_config()
+    return {**DEFAULT_CACHE, **config.get("cache", {})}
+
+def get_web_config():
+    config = get_or_create_config()
+    return {**DEFAULT_WEB, **config.get("web", {})}
+
+def get_auth_config():
+    config = get_or_create_config()
+    return {**DEFAULT_AUTH, **config.get("auth", {})}
+
 def set_last_backup_time():
     from datetime import datetime
-    config = get_or_create_config()
-    config["autobackup"]["last_backup"] = datetime.now().isoformat()
-    
-    try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error updating last backup time: {e}")
-        return False
\ No newline at end of file
+    with lock_for(CONFIG_FILE).exclusive():
+        config = get_or_create_config()
+        config["autobackup"]["last_backup"] = datetime.now().isoformat()
+        
+        try:
+            _write_config(config)
+            return True
+        except Exception as e:
+            print(f"Error updating last backup time: {e}")
+            return False
\ No newline at end of file
@@ -1,14 +1,17 @@
 # core/database.py
-import os, json, uuid, re
-from cryptography.fernet import Fernet
-from core.utils import RECORDS_PATH, BACKUP_DIR, timestamp
-from core.logger import log
-from core.config_manager import get_encryption_key
+import os, json, uuid, re, threading
+from core.utils import DATA_DIR, BACKUP_DIR, timestamp
+from core.logger import log, log_event
+from core.config_manager import get_fernet, get_cache_config
 from core.validators import DataValidator
+from core.storage import get_store
+from core.indexes import RecordIndex, RecordStats, TrigramIndex
+from core.columns import RecordTable
+from core.file_lock import atomic_write
+from core.batch_validation import parallel_map
 
 def ensure_data_dir():
-    d = os.path.dirname(RECORDS_PATH)
-    os.makedirs(d, exist_ok=True)
+    os.makedirs(DATA_DIR, exist_ok=True)
     os.makedirs(BACKUP_DIR, exist_ok=True)
 
 def get_exports_dir():
@@ -21,36 +24,270 @@ def get_exports_dir():
     os.makedirs(exports_dir, exist_ok=True)
     return exports_dir
 
-def load_records():
-    key = get_encryption_key()
+# ========== Record cache ==========
+# Decoded records shared by every reader in this process. The cache remembers
+# the store signature it reflects: appends from any process are replayed from
+# the log tail, anything else (compaction, save_records, restore) reloads.
+# Derived structures (search indexes, aggregates) ride along and receive the
+# same replayed entries, so they stay current without being rebuilt.
+# With the "columnar" cache option the records are a RecordTable: one column
+# per field, rows handed out as dict-like views.
+# Replayed appends go into the cached structures in place, so a write costs
+# O(entries); only deletes (and replaced table rows) build new structures.
+# Readers never lock: they may see records appended after they started, but
+# never a partial record or shifted positions.
+_cache_lock = threading.Lock()
+_cache = {
+    "state": None,          # (records, positions) - appended to, replaced on deletes
+    "manifest": None,
+    "log_offset": 0,
+    "derived": {}
+}
+
+def _in_place(state, entries):
+    # whole-record puts are safe to apply under readers; a table row is
+    # written field by field, so only brand-new rows go in place there
+    table = isinstance(state[0], RecordTable)
+    added = set()
+    for entry in entries:
+        if entry["op"] != "put":
+            return False
+        if table:
+            rid = entry["record"].get("id")
+            if rid in state[1] or rid in added:
+                return False
+            added.add(rid)
+    return True
+
+def _apply_entries(state, entries):
+    if _in_place(state, entries):
+        records, positions = state
+        for entry in entries:
+            rid = entry["record"].get("id")
+            i = positions.get(rid)
+            if i is not None:
+                records[i] = entry["record"]
+            else:
+                records.append(entry["record"])
+                positions[rid] = len(records) - 1
+        return state
+    if isinstance(state[0], RecordTable):
+        return _apply_table_entries(state, entries)
+    records, positions = list(state[0]), dict(state[1])
+    deleted = False
+    
+    for entry in entries:
+        if entry["op"] == "put":
+            rid = entry["record"].get("id")
+            if rid in positions:
+                records[positions[rid]] = entry["record"]
+            else:
+                positions[rid] = len(records)
+                records.append(entry["record"])
+        elif entry["op"] == "del":
+            i = positions.pop(entry["id"], None)
+            if i is not None:
+                records[i] = None
+                deleted = True
+    
+    if deleted:
+        records = [r for r in records if r is not None]
+        positions = {r.get("id"): i for i, r in enumerate(records)}
+    return records, positions
+
+def _apply_table_entries(state, entries):
+    table, positions = state[0].copy(), dict(state[1])
+    deleted = set()
+    
+    for entry in entries:
+        if entry["op"] == "put":
+            rid = entry["record"].get("id")
+            if rid in positions:
+                table.set(positions[rid], entry["record"])
+            else:
+                positions[rid] = len(table)
+                table.append(entry["record"])
+        elif entry["op"] == "del":
+            i = positions.pop(entry["id"], None)
+            if i is not None:
+                deleted.add(i)
+    
+    if deleted:
+        table = table.without(deleted)
+        positions = {rid: i for i, rid in enumerate(table.column("id"))}
+    return table, positions
+
+def _refresh_cache():
+    # caller holds _cache_lock
+    store = get_store()
+    manifest_stat, log_stat = store.signature()
+    log_size = log_stat[2] if log_stat else 0
+    
+    if _cache["state"] is not None and manifest_stat == _cache["manifest"]:
+        if log_size == _cache["log_offset"]:
+            return _cache["state"]
+        if log_size > _cache["log_offset"]:
+            entries, offset = store.read_log_from(_cache["log_offset"])
+            if entries:
+                _cache["state"] = _apply_entries(_cache["state"], entries)
+                for derived in _cache["derived"].values():
+                    derived.apply(entries)
+            _cache["log_offset"] = offset
+            return _cache["state"]
+    
+    records, manifest_stat, offset = store.snapshot()
+    if get_cache_config()["columnar"]:
+        records = RecordTable.from_records(records)
+    _cache["state"] = (records, {r.get("id"): i for i, r in enumerate(records)})
+    _cache["manifest"] = manifest_stat
+    _cache["log_offset"] = offset
+    _cache["derived"] = {}
+    return _cache["state"]
+
+def _cache_is_current(store):
+    # caller holds _cache_lock
+    manifest_stat, log_stat = store.signature()
+    return (_cache["state"] is not None and manifest_stat == _cache["manifest"]
+            and (log_stat[2] if log_stat else 0) == _cache["log_offset"])
+
+# The store lock always comes before _cache_lock and _index_lock: writers hold
+# it while they read through the cache, so a refresh (which reads the store)
+# takes it first. Up-to-date caches are answered without it.
+def _cached_state():
+    store = get_store()
+    with _cache_lock:
+        if _cache_is_current(store):
+            return _cache["state"]
+    with store.read_lock(), _cache_lock:
+        return _refresh_cache()
+
+def _cached_derived(name, build):
+    """Return (state, structure), building the structure from the records once"""
+    store = get_store()
+    with _cache_lock:
+        if _cache_is_current(store) and name in _cache["derived"]:
+            return _cache["state"], _cache["derived"][name]
+    with store.read_lock(), _cache_lock:
+        state = _refresh_cache()
+        if name not in _cache["derived"]:
+            _cache["derived"][name] = build(state[0])
+        return state, _cache["derived"][name]
+
+def _cached_records():
     ensure_data_dir()
     
-    if not os.path.exists(RECORDS_PATH):
-        return []
-        
     try:
-        with open(RECORDS_PATH, "rb") as f:
-            token = f.read()
-        fernet = Fernet(key)
-        data = fernet.decrypt(token)
-        return json.loads(data.decode())
+        return _cached_state()[0]
     except Exception as e:
         print(f"Error loading records: {e}")
         return []
 
-def save_records(records):
+def invalidate_records_cache():
+    with _cache_lock:
+        _cache["state"] = None
+        _cache["derived"] = {}
+
+# ========== Secondary indexes ==========
+# id/phone/national_id lookups and running stats without decoding any segment:
+# start from the on-disk checkpoint and replay whatever the log added since.
+_index_lock = threading.RLock()
+_index = {
+    "index": None,
+    "stats": None,
+    "manifest": None,
+    "log_offset": 0
+}
 
-    key = get_encryption_key()
+def _current_checkpoint():
+    """Return the up-to-date (RecordIndex, RecordStats) pair"""
+    store = get_store()
+    store.ensure()
+    
+    with _index_lock:
+        manifest_stat, log_stat = store.signature()
+        if (_index["index"] is not None and manifest_stat == _index["manifest"]
+                and (log_stat[2] if log_stat else 0) == _index["log_offset"]):
+            return _index["index"], _index["stats"]
+    
+    with store.read_lock(), _index_lock:
+        manifest_stat, log_stat = store.signature()
+        log_size = log_stat[2] if log_stat else 0
+        
+        if (_index["index"] is None or manifest_stat != _index["manifest"]
+                or log_size < _index["log_offset"]):
+            checkpoint = store.load_index(manifest_stat)
+            if checkpoint:
+                _index["index"], _index["stats"], _index["log_offset"] = checkpoint
+            else:
+                records, manifest_stat, offset = store.snapshot()
+                _index["index"], _index["stats"] = RecordIndex.build(records), RecordStats.build(records)
+                _index["log_offset"] = offset
+                store.save_index(_index["index"], _index["stats"], manifest_stat, offset)
+            _index["manifest"] = manifest_stat
+        
+        if log_size > _index["log_offset"]:
+            entries, _index["log_offset"] = store.read_log_from(_index["log_offset"])
+            _index["index"].apply(entries)
+            _index["stats"].apply(entries)
+        
+        return _index["index"], _index["stats"]
+
+def _current_index():
+    return _current_checkpoint()[0]
+
+def load_records():
+    # callers are free to mutate what they get back
+    return [dict(r) for r in _cached_records()]
+
+def save_records(records):
     ensure_data_dir()
     
     try:
-        fernet = Fernet(key)
-        data = json.dumps(records, ensure_ascii=False).encode()
-        token = fernet.encrypt(data)
-        with open(RECORDS_PATH, "wb") as fh:
-            fh.write(token)
+        get_store().replace_all(records)
     except Exception as e:
         print(f"Error saving records: {e}")
+    finally:
+        invalidate_records_cache()
+
+def write_lock():
+    """Hold the store across a read-modify-write (see SegmentStore.write_lock)"""
+    ensure_data_dir()
+    return get_store().write_lock()
+
+def put_records(records):
+    """Write many new or changed records with one log append"""
+    ensure_data_dir()
+    
+    try:
+        get_store().append_many(records)
+        return True
+    except Exception as e:
+        print(f"Error updating records: {e}")
+        return False
+
+def delete_records(record_ids):
+    """Delete many records with one log append; returns how many existed"""
+    ensure_data_dir()
+    with write_lock():
+        index = _current_index()
+        present = [rid for rid in record_ids if index.contains(rid)]
+        get_store().delete_many(present)
+    return len(present)
+
+def update_record(record):
+    """Write an edited record; False if it was deleted in the meantime"""
+    ensure_data_dir()
+    
+    try:
+        with write_lock():
+            # another process may have deleted it since it was loaded
+            if not _current_index().contains(record.get("id")):
+                return False
+            get_store().update(record)
+        return True
+    except Exception as e:
+        print(f"Error updating record: {e}")
+        return False
 
 def validate_iranian_phone(phone):
     if not phone:
@@ -136,18 +373,22 @@ def capitalize_name(name):
     return name[0].upper() + name[1:].lower()
 
 def is_duplicate_record(phone=None, national_id=None):
-    records = load_records()
+    index = _current_index()
     
-    for record in records:
-        if phone and record.get('phone') and record['phone'] == phone:
-            return True, f"Record with phone {phone} already exists (ID: {record['id']})"
-        
-        if national_id and record.get('national_id') and record['national_id'] == national_id:
-            return True, f"Record with national ID {national_id} already exists (ID: {record['id']})"
+    if phone:
+        rid = index.find_phone(phone)
+        if rid:
+            return True, f"Record with phone {phone} already exists (ID: {rid})"
+    
+    if national_id:
+        rid = index.find_national_id(national_id)
+        if rid:
+            return True, f"Record with national ID {national_id} already exists (ID: {rid})"
     
     return False, ""
 
-def add_record(first, last, national_id=None, dob=None, phone=None, address=None, tags=None, notes=None):
+def _prepare_record(first, last, national_id=None, dob=None, phone=None, address=None, tags=None, notes=None,
+                    national_id_valid=None):
     
     is_valid_first, first_msg = DataValidator.validate_english_name(first, "First name")
     if not is_valid_first:
@@ -157,7 +398,8 @@ def add_record(first, last, national_id=None, dob=None, phone=None, address=None
     if not is_valid_last:
         raise ValueError(f"Last name validation error: {last_msg}")
     
-    if national_id:
+    # batches pre-check the whole national ID column; only failures need the message
+    if national_id and not national_id_valid:
         is_valid_national, national_msg = DataValidator.validate_national_id(national_id)
         if not is_valid_national:
             raise ValueError(f"National ID validation error: {national_msg}")
@@ -177,15 +419,8 @@ def add_record(first, last, national_id=None, dob=None, phone=None, address=None
     if address:
         address = DataValidator.capitalize_city(address)
     
-    is_duplicate, duplicate_msg = is_duplicate_record(phone=phone, national_id=national_id)
-    if is_duplicate:
-        raise ValueError(f"Duplicate record: {duplicate_msg}")
-    
-    recs = load_records()
-    rid = str(uuid.uuid4())[:8].upper()
-    
-    item = {
-        "id": rid,
+    return {
+        "id": str(uuid.uuid4())[:8].upper(),
         "first_name": first,
         "last_name": last,
         "national_id": national_id,
@@ -203,121 +438,363 @@ def add_record(first, last, national_id=None, dob=None, phone=None, address=None
             'address': address
         })
     }
+
+def add_record(first, last, national_id=None, dob=None, phone=None, address=None, tags=None, notes=None):
+    
+    item = _prepare_record(first, last, national_id, dob, phone, address, tags, notes)
+    rid = item["id"]
+    
+    # the duplicate check and the insert happen under one store lock, so two
+    # processes cannot both add the same phone or national ID
+    with write_lock():
+        is_duplicate, duplicate_msg = is_duplicate_record(phone=phone, national_id=national_id)
+        if is_duplicate:
+            raise ValueError(f"Duplicate record: {duplicate_msg}")
+        get_store().append(item)
     
     anomalies = DataValidator.detect_anomaly(item)
     if anomalies:
         print(f"Security warning: {', '.join(anomalies)}")
-        log(f"SECURITY_WARNING: Anomalies detected in record {rid} - {anomalies}")
+        log_event("SECURITY_WARNING", f"Anomalies detected - {anomalies}", record_id=rid)
     
-    recs.append(item)
-    save_records(recs)
-    log(f"ADD: id={rid} first={first} last={last} national_id={national_id} phone={phone} security_score={item['security_score']}")
+    log_event("ADD", f"first={item['first_name']} last={item['last_name']} national_id={national_id} phone={phone} security_score={item['security_score']}", record_id=rid)
     return rid 
 
+IMPORT_FIELDS = ["first_name", "last_name", "national_id", "dob", "phone", "address", "tags", "notes"]
+
+def _import_fields(row):
+    """Import row as text fields, or an error message for the row"""
+    if not isinstance(row, dict):
+        return "Row is not a record"
+    fields = {k: (row.get(k) or None) for k in IMPORT_FIELDS}
+    if not fields["address"]:
+        fields["address"] = row.get("city") or None
+    for k, v in fields.items():
+        if isinstance(v, bool) or not isinstance(v, (str, int, float, type(None))):
+            return f"Field {k} must be text or a number"
+        if isinstance(v, (int, float)):
+            v = str(v)
+        if isinstance(v, str):
+            fields[k] = v.strip() or None
+    return fields
+
+def _prepare_import_row(job):
+    """Validate one normalized import row; returns (record, anomalies, error). Runs in pool workers."""
+    fields, national_id_valid = job
+    if isinstance(fields, str):
+        return None, None, fields
+    try:
+        item = _prepare_record(fields["first_name"] or "", fields["last_name"] or "",
+                               fields["national_id"], fields["dob"], fields["phone"],
+                               fields["address"], fields["tags"], fields["notes"],
+                               national_id_valid=national_id_valid)
+    except ValueError as e:
+        return None, None, str(e)
+    return item, DataValidator.detect_anomaly(item), None
+
+def add_records_batch(rows):
+    """Validate and insert many records with a single store write.
+    rows are dicts keyed like an export file; returns (added_ids, errors)
+    where errors lists (row_number, message) for every rejected row."""
+    seen_phones = {}
+    seen_national_ids = {}
+    batch_ids = set()
+    items = []
+    errors = []
+    
+    # validation is independent per row and fans out over cores;
+    # duplicate checks need the batch order so they stay here
+    rows = [_import_fields(row) for row in rows]
+    national_ids = DataValidator.validate_national_ids([None if isinstance(f, str) else f["national_id"] for f in rows])
+    prepared = parallel_map(_prepare_import_row, zip(rows, national_ids))
+    
+    # duplicate checks and the insert run under one store lock, so rows
+    # added meanwhile by other processes are seen and nothing is added twice
+    with write_lock():
+        index = _current_index()
+        for n, (item, anomalies, error) in enumerate(prepared, 1):
+            if error:
+                errors.append((n, error))
+                continue
+            
+            phone = item["phone"]
+            national_id = item["national_id"]
+            is_duplicate, duplicate_msg = is_duplicate_record(phone=phone, national_id=national_id)
+            if not is_duplicate and phone in seen_phones:
+                is_duplicate, duplicate_msg = True, f"Phone {phone} repeats row {seen_phones[phone]}"
+            if not is_duplicate and national_id in seen_national_ids:
+                is_duplicate, duplicate_msg = True, f"National ID {national_id} repeats row {seen_national_ids[national_id]}"
+            if is_duplicate:
+                errors.append((n, f"Duplicate record: {duplicate_msg}"))
+                continue
+            
+            while index.contains(item["id"]) or item["id"] in batch_ids:
+                item["id"] = str(uuid.uuid4())[:8].upper()
+            batch_ids.add(item["id"])
+            if phone:
+                seen_phones[phone] = n
+            if national_id:
+                seen_national_ids[national_id] = n
+            
+            if anomalies:
+                log_event("SECURITY_WARNING", f"Anomalies detected - {anomalies}", record_id=item['id'])
+            items.append(item)
+        
+        if items:
+            get_store().append_many(items)
+    log(f"IMPORT: added={len(items)} rejected={len(errors)}")
+    return [item["id"] for item in items], errors
+
+def read_import_rows(stream, format="csv"):
+    """Parse an import file (text stream) into row dicts for add_records_batch"""
+    import csv
+    
+    if format == "json":
+        data = json.load(stream)
+        if not isinstance(data, list):
+            raise ValueError("JSON import must be a list of records")
+        return data
+    return _csv_rows(csv.DictReader(stream))
+
+def _csv_rows(reader):
+    # a malformed file fails the import as a whole, like unreadable JSON
+    import csv
+    
+    try:
+        yield from reader
+    except csv.Error as e:
+        raise ValueError(f"CSV error near line {reader.line_num + 1}: {e}")
+
 
 def search_by_id(rid):
-    recs = load_records()
-    for r in recs:
-        if r["id"] == rid:
-            return r
+    ensure_data_dir()
+    
+    try:
+        if _cache["state"] is None:
+            # cold process: the index says whether to touch a segment at all
+            return get_store().get(rid) if _current_index().contains(rid) else None
+        records, positions = _cached_state()
+    except Exception as e:
+        print(f"Error loading records: {e}")
+        return None
+    
+    i = positions.get(rid)
+    return dict(records[i]) if i is not None else None
+
+def _trigram_state():
+    ensure_data_dir()
+    
+    try:
+        return _cached_derived("trigrams", TrigramIndex.build)
+    except Exception as e:
+        print(f"Error loading records: {e}")
+        return ([], {}), TrigramIndex()
+
+def _in_record_order(state, ids):
+    records, positions = state
+    return [records[i] for i in sorted(positions[rid] for rid in ids if rid in positions)]
+
+def indexed_ids(field, value, exact=True):
+    """Ids that may have field == value (or contain it when exact is False),
+    or None when no index covers the field"""
+    if not value:
+        return None
+    
+    if exact and field in ("id", "phone", "national_id"):
+        if field == "id":
+            state = _cached_state()
+            return {value} if value in state[1] else set()
+        index = _current_index()
+        return index.phone_ids(value) if field == "phone" else index.national_id_ids(value)
+    
+    _, trigrams = _trigram_state()
+    if field in trigrams.fields:
+        return trigrams.candidates(field, value)
     return None
 
+def get_records_by_ids(ids):
+    """Copies of the given records, in store order"""
+    return [dict(r) for r in _in_record_order(_cached_state(), ids)]
+
 def search_by_name_partial(term):
-    recs = load_records()
+    state, trigrams = _trigram_state()
     term_low = term.lower()
     result = []
     
+    first_ids = trigrams.candidates("first_name", term)
+    last_ids = trigrams.candidates("last_name", term)
+    if first_ids is None or last_ids is None:
+        recs = state[0]
+    else:
+        recs = _in_record_order(state, first_ids | last_ids)
+    
     for r in recs:
         first_match = r.get("first_name","") and term_low in r["first_name"].lower()
         last_match = r.get("last_name","") and term_low in r["last_name"].lower()
         
         if first_match or last_match:
-            result.append(r)
+            result.append(dict(r))
             
     return result
 
 def search_by_national_id(national_id):
-    recs = load_records()
-    for r in recs:
-        if r.get("national_id") == national_id:
-            return r
-    return None
+    rid = _current_index().find_national_id(national_id)
+    return search_by_id(rid) if rid else None
 
 def search_by_phone(phone):
-    recs = load_records()
-    for r in recs:
-        if r.get("phone") == phone:
-            return r
-    return None
+    rid = _current_index().find_phone(phone)
+    return search_by_id(rid) if rid else None
+
+def _search_candidates(trigrams, text_filters, national_id, phone, search_mode):
+    """Ids that can possibly match, or None when a full scan is needed"""
+    id_sets = []
+    
+    for field, term in text_filters:
+        ids = trigrams.candidates(field, term)
+        if ids is None:
+            if search_mode != "and":
+                return None
+            continue
+        id_sets.append(ids)
+    
+    if national_id or phone:
+        index = _current_index()
+        if national_id:
+            id_sets.append(index.national_id_ids(national_id))
+        if phone:
+            id_sets.append(index.phone_ids(phone))
+    
+    if not id_sets:
+        return None
+    if search_mode == "and":
+        return set.intersection(*id_sets)
+    return set.union(*id_sets)
 
 def advanced_search(first_name=None, last_name=None, city=None, national_id=None, phone=None, search_mode="and"):
-    records = load_records()
+    state, trigrams = _trigram_state()
+    records = state[0]
     
     if not any([first_name, last_name, city, national_id, phone]):
-        return records
+        return [dict(r) for r in records]
     
-    results = []
+    text_filters = [(field, term) for field, term in
+                    (("first_name", first_name), ("last_name", last_name), ("address", city))
+                    if term and term.strip()]
+    candidates = _search_candidates(
+        trigrams, text_filters,
+        national_id if national_id and national_id.strip() else None,
+        phone if phone and phone.strip() else None,
+        search_mode
+    )
+    positions = None
+    if candidates is not None:
+        positions = sorted(state[1][rid] for rid in candidates if rid in state[1])
     
-    for record in records:
-        matches = []
-        
-        if first_name and first_name.strip():
-            first_name_match = False
-            if record.get('first_name') and first_name.lower() in record['first_name'].lower():
-                first_name_match = True
-            matches.append(first_name_match)
-        
-        if last_name and last_name.strip():
-            last_name_match = False
-            if record.get('last_name') and last_name.lower() in record['last_name'].lower():
-                last_name_match = True
-            matches.append(last_name_match)
-        
-        if city and city.strip():
-            city_match = False
-            if record.get('address') and city.lower() in record['address'].lower():
-                city_match = True
-            matches.append(city_match)
-        
-        if national_id and national_id.strip():
-            national_id_match = False
-            if record.get('national_id') and record['national_id'] == national_id:
-                national_id_match = True
-            matches.append(national_id_match)
-        
-        if phone and phone.strip():
-            phone_match = False
-            if record.get('phone') and record['phone'] == phone:
-                phone_match = True
-            matches.append(phone_match)
-        
-        if search_mode == "and":
-            if matches and all(matches):
-                results.append(record)
-        else:
-            if matches and any(matches):
-                results.append(record)
+    checks = []
+    for field, term in text_filters:
+        checks.append((field, lambda value, term=term.lower(): bool(value) and term in value.lower()))
+    for field, term in (("national_id", national_id), ("phone", phone)):
+        if term and term.strip():
+            checks.append((field, lambda value, term=term: bool(value) and value == term))
+    if not checks:
+        return []
     
-    return results
+    fields = [field for field, _ in checks]
+    tests = [test for _, test in checks]
+    combine = all if search_mode == "and" else any
+    matched = _matching_positions(
+        records, fields, lambda *values: combine(test(value) for test, value in zip(tests, values)), positions)
+    return [dict(records[i]) for i in matched]
+
+# ========== Column scans ==========
+# Field-level scans over the cached records. Over a columnar cache they read
+# contiguous columns and never build a row; over dicts they fall back to get().
+# On a dictionary-encoded column the predicate runs once per distinct value and
+# each record costs one code lookup.
+
+def _matching_positions(records, fields, predicate, positions=None):
+    if positions is None:
+        positions = range(len(records))
+    if isinstance(records, RecordTable):
+        if len(fields) == 1 and fields[0] in records.encoded:
+            encoded = records.encoded[fields[0]]
+            hits = {code for code, value in enumerate(encoded.values) if predicate(value)}
+            codes = encoded.codes
+            return [i for i in positions if codes[i] in hits]
+        columns = [records.column(field) for field in fields]
+        if len(columns) == 1:
+            column = columns[0]
+            return [i for i in positions if predicate(column[i])]
+        return [i for i in positions if predicate(*[column[i] for column in columns])]
+    return [i for i in positions if predicate(*[records[i].get(field) for field in fields])]
+
+def scan_records(fields, predicate):
+    """Copies of the records for which predicate(*values) is true, in store
+    order; fields is one field name or a tuple of them"""
+    if isinstance(fields, str):
+        fields = (fields,)
+    records = _cached_records()
+    return [dict(records[i]) for i in _matching_positions(records, fields, predicate)]
+
+def count_records(fields, predicate):
+    """Number of records for which predicate(*values) is true"""
+    if isinstance(fields, str):
+        fields = (fields,)
+    return len(_matching_positions(_cached_records(), fields, predicate))
+
+def find_records(field, value):
+    """Copies of the records whose field equals value ignoring case
+    (an empty value matches unset fields)"""
+    records = _cached_records()
+    if isinstance(records, RecordTable) and field in records.encoded:
+        encoded = records.encoded[field]
+        wanted = set(encoded.codes_for(value))
+        codes = encoded.codes
+        return [dict(records[i]) for i in range(len(records)) if codes[i] in wanted]
+    folded = (value or "").lower()
+    return [dict(r) for r in records if str(r.get(field) or "").lower() == folded]
 
 def delete_record_by_id(record_id):
-    records = load_records()
+    if not _current_index().contains(record_id):
+        return False
+    ensure_data_dir()
+    return get_store().delete(record_id) is not None
+
+EXPORT_FIELDS = ["id", "first_name", "last_name", "national_id", "dob", "phone", "address", "tags", "notes", "created_at"]
+EXPORT_CHUNK_SIZE = 500
+
+def iter_records():
+    """Yield every record without materializing the whole dataset"""
+    ensure_data_dir()
+    
+    if _cache["state"] is not None:
+        # a warm cache is already in memory; writes only append or swap whole records in it
+        yield from _cached_state()[0]
+    else:
+        yield from get_store().iter_records()
+
+def iter_csv_chunks(records, fields=EXPORT_FIELDS, chunk_size=EXPORT_CHUNK_SIZE):
+    """Render records as CSV text, one chunk per chunk_size rows"""
+    import csv
+    import io
     
-    for i, record in enumerate(records):
-        if record["id"] == record_id:
-            del records[i]
-            save_records(records)
-            return True
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
     
-    return False
+    for i, r in enumerate(records, 1):
+        writer.writerow([r.get(k, "") for k in fields])
+        if i % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    
+    yield buffer.getvalue()
 
 def export_csv(path=None):
-    import csv
     import time
     
-    recs = load_records()
-    
-    if not recs:
+    if get_records_count() == 0:
         print("No records to export")
         return 0, None
     
@@ -333,7 +810,13 @@ def export_csv(path=None):
         if not os.path.isabs(path):
             path = os.path.join(exports_dir, path)
     
-    keys = ["id", "first_name", "last_name", "national_id", "dob", "phone", "address", "tags", "notes", "created_at"]
+    count = 0
+    
+    def counted():
+        nonlocal count
+        for r in iter_records():
+            count += 1
+            yield r
     
     try:
         # Check if file exists and create backup
@@ -344,20 +827,17 @@ def export_csv(path=None):
             print(f"Backup created: {backup_path}")
         
         with open(path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
-            writer.writeheader()
-            for r in recs:
-                writer.writerow({k: r.get(k, "") for k in keys})
+            for chunk in iter_csv_chunks(counted()):
+                f.write(chunk)
                 
-        log(f"EXPORT: path={path} count={len(recs)}")
-        return len(recs), path
+        log(f"EXPORT: path={path} count={count}")
+        return count, path
         
     except Exception as e:
         print(f"Export failed: {e}")
         return 0, None
 
 def create_backup():
-    import shutil
     import time
     
     ensure_data_dir()
@@ -371,30 +851,49 @@ def create_backup():
         t = time.strftime("%Y%m%d_%H%M%S")
         target = os.path.join(BACKUP_DIR, f"backup_{t}.enc")
         
-        if os.path.exists(RECORDS_PATH):
-            shutil.copy(RECORDS_PATH, target)
-            log(f"BACKUP: created {target}")
-            
-            # Clean up old backups
-            cleanup_old_backups()
-            
-            return target
-        else:
-            print("No records file found for backup")
-            return None
+        # Backups stay a single encrypted snapshot, independent of the store layout
+        fernet = get_fernet()
+        token = fernet.encrypt(json.dumps(recs, ensure_ascii=False).encode())
+        atomic_write(target, token)
+        log(f"BACKUP: created {target}")
+        
+        # Clean up old backups
+        cleanup_old_backups()
+        
+        return target
             
     except Exception as e:
         print(f"Backup failed: {e}")
         return None
 
-def get_system_stats():
-    records = load_records()
-    from core.auth import load_users
+def get_record_summary():
+    """Column summary of every record, kept up to date by RecordStats; no
+    records are read unless a deleted oldest/newest record must be refetched"""
+    with get_store().read_lock(), _index_lock:
+        _, running = _current_checkpoint()
+        # an extreme that was deleted or edited away is refetched once
+        if running.oldest is None and running.oldest_id is not None:
+            running.oldest = search_by_id(running.oldest_id)
+        if running.newest is None and running.newest_id is not None:
+            running.newest = search_by_id(running.newest_id)
+        
+        return {
+            "total_records": len(running.entries),
+            "records_by_city": dict(running.by_city),
+            "filled": dict(running.filled),
+            "valid_phones": running.valid_phones,
+            "valid_national_ids": running.valid_national_ids,
+            "oldest_record": dict(running.oldest) if running.oldest else None,
+            "newest_record": dict(running.newest) if running.newest else None
+        }
+
+def get_system_stats(summary=None):
+    from core.auth import user_count
     
     stats = {
-        "total_records": len(records),
-        "total_users": len(load_users()),
-        "data_size": os.path.getsize(RECORDS_PATH) if os.path.exists(RECORDS_PATH) else 0,
+        "total_records": 0,
+        "total_users": user_count(),
+        "data_size": get_store().disk_size(),
         "last_backup": get_last_backup_info(),
         "records_by_city": {},
         "records_with_phone": 0,
@@ -403,36 +902,44 @@ def get_system_stats():
         "newest_record": None
     }
     
-    for record in records:
-        city = record.get('address', 'Unknown')
-        stats["records_by_city"][city] = stats["records_by_city"].get(city, 0) + 1
-        
-        if record.get('phone'):
-            stats["records_with_phone"] += 1
-        if record.get('national_id'):
-            stats["records_with_national_id"] += 1
-        
-        if stats["oldest_record"] is None or record.get('created_at', '') < stats["oldest_record"].get('created_at', ''):
-            stats["oldest_record"] = record
-        if stats["newest_record"] is None or record.get('created_at', '') > stats["newest_record"].get('created_at', ''):
-            stats["newest_record"] = record
+    try:
+        summary = summary or get_record_summary()
+        stats["total_records"] = summary["total_records"]
+        stats["records_by_city"] = summary["records_by_city"]
+        stats["records_with_phone"] = summary["filled"]["phone"]
+        stats["records_with_national_id"] = summary["filled"]["national_id"]
+        stats["oldest_record"] = summary["oldest_record"]
+        stats["newest_record"] = summary["newest_record"]
+    except Exception as e:
+        print(f"Error loading stats: {e}")
     
     return stats
 
+_backup_info = {"stat": None, "value": None}
+
 def get_last_backup_info():
     if not os.path.exists(BACKUP_DIR):
         return "No backups found"
     
+    # the directory mtime moves whenever a backup is added or removed
+    dir_stat = os.stat(BACKUP_DIR)
+    key = (dir_stat.st_ino, dir_stat.st_mtime_ns)
+    if _backup_info["stat"] == key:
+        return _backup_info["value"]
+    
     backups = [f for f in os.listdir(BACKUP_DIR) if f.startswith('backup_') and f.endswith('.enc')]
     if not backups:
-        return "No backups found"
-    
-    latest_backup = sorted(backups)[-1]
-    backup_path = os.path.join(BACKUP_DIR, latest_backup)
-    backup_time = os.path.getctime(backup_path)
+        value = "No backups found"
+    else:
+        latest_backup = sorted(backups)[-1]
+        backup_path = os.path.join(BACKUP_DIR, latest_backup)
+        backup_time = os.path.getctime(backup_path)
+        
+        from datetime import datetime
+        value = f"{latest_backup} ({datetime.fromtimestamp(backup_time).strftime('%Y-%m-%d %H:%M:%S')})"
     
-    from datetime import datetime
-    return f"{latest_backup} ({datetime.fromtimestamp(backup_time).strftime('%Y-%m-%d %H:%M:%S')})"
+    _backup_info["stat"], _backup_info["value"] = key, value
+    return value
 
 def get_available_backups():
     if not os.path.exists(BACKUP_DIR):
@@ -466,8 +973,12 @@ def restore_from_backup(backup_filename):
         if current_backup:
             print(f"Current data backed up to: {current_backup}")
         
-        import shutil
-        shutil.copy(backup_path, RECORDS_PATH)
+        with open(backup_path, "rb") as f:
+            token = f.read()
+        fernet = get_fernet()
+        records = json.loads(fernet.decrypt(token).decode())
+        get_store().replace_all(records)
+        invalidate_records_cache()
         log(f"RESTORE: restored from {backup_filename}")
         return True, "Restore completed successfully"
     except Exception as e:
@@ -490,13 +1001,15 @@ def cleanup_old_backups(max_backups=10):
             print(f"Error deleting backup {backup['filename']}: {e}")
 
 def get_records_count():
-    recs = load_records()
-    return len(recs)
+    if _cache["state"] is not None:
+        return len(_cached_records())
+    return len(_current_index().entries)
 
 def delete_all_records():
     try:
-        if os.path.exists(RECORDS_PATH):
-            os.remove(RECORDS_PATH)
+        if get_store().exists():
+            get_store().clear()
+            invalidate_records_cache()
             print("All records deleted")
             log("DELETE_ALL: all records removed")
         else:
@@ -505,8 +1018,8 @@ def delete_all_records():
         print(f"Delete failed: {e}")
 
 def get_recent_records(limit=5):
-    recs = load_records()
-    return recs[-limit:] if recs else []
+    recs = _cached_records()
+    return [dict(r) for r in recs[-limit:]] if recs else []
 
 def show_exports_location():
     exports_dir = get_exports_dir()
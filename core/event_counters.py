@@ -0,0 +1,225 @@
+# core/event_counters.py
+import os
+import json
+import time
+import atexit
+import threading
+from datetime import datetime, timedelta
+from core.utils import LOG_INDEX_PATH, LOG_COUNTERS_PATH, LOG_ARCHIVE_DIR
+from core.file_lock import atomic_write
+
+# Rolling event counters in per-minute, per-hour and per-day buckets, kept in
+# logs.counters. They are fed from the event index rows (logs.idx) as lines are
+# written and remember how far into logs.idx they have counted, so any process
+# can catch up from the last saved state instead of rescanning the log.
+RESOLUTIONS = {
+    # name: (timestamp prefix length, buckets kept, bucket length)
+    "minute": (16, 24 * 60, timedelta(minutes=1)),
+    "hour": (13, 30 * 24, timedelta(hours=1)),
+    "day": (10, 400, timedelta(days=1)),
+}
+BUCKET_FORMATS = {"minute": "%Y-%m-%d %H:%M", "hour": "%Y-%m-%d %H", "day": "%Y-%m-%d"}
+SECURITY_EVENTS = {"SECURITY_WARNING", "SECURITY_ALERT", "AUTOBACKUP", "USERADD", "USERDEL", "LOGIN_THROTTLED"}
+SAVE_INTERVAL = 5.0
+
+_lock = threading.Lock()
+_state = {"loaded": None, "saved_at": 0.0, "dirty": False, "data": None}
+
+
+def _empty():
+    return {"index": [None, 0], "minute": {}, "hour": {}, "day": {}}
+
+
+def _categories(event_type):
+    categories = ["events"]
+    if event_type == "LOGIN_FAIL":
+        categories.append("failed_logins")
+    elif event_type == "LOGIN":
+        categories.append("logins")
+    if event_type in SECURITY_EVENTS:
+        categories.append("security_events")
+    return categories
+
+
+def _count(data, stamp, event_type):
+    for name, (length, _, _) in RESOLUTIONS.items():
+        bucket = data[name].setdefault(stamp[:length], {})
+        for category in _categories(event_type):
+            bucket[category] = bucket.get(category, 0) + 1
+
+
+def _count_rows(data, raw):
+    for row in raw.decode("utf-8", errors="replace").splitlines():
+        parts = row.split("\t")
+        if len(parts) == 5:
+            _count(data, parts[1], parts[2])
+
+
+def _file_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _load():
+    # caller holds _lock; re-read only when another process has saved since
+    key = _file_key(LOG_COUNTERS_PATH)
+    if _state["data"] is not None and key == _state["loaded"]:
+        return _state["data"]
+    data = None
+    if key is not None:
+        try:
+            with open(LOG_COUNTERS_PATH, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+    if data is None:
+        data = _rebuild()
+        _state["dirty"] = True
+    _state.update(loaded=key, data=data)
+    return data
+
+
+def _rebuild():
+    """Counters for every archived index from scratch; the live one is caught up after"""
+    data = _empty()
+    if os.path.exists(LOG_ARCHIVE_DIR):
+        for name in sorted(os.listdir(LOG_ARCHIVE_DIR)):
+            if name.startswith("logs_") and name.endswith(".idx"):
+                with open(os.path.join(LOG_ARCHIVE_DIR, name), "rb") as f:
+                    _count_rows(data, f.read())
+    return data
+
+
+def _catch_up(data):
+    try:
+        st = os.stat(LOG_INDEX_PATH)
+    except OSError:
+        return
+    ino, position = data["index"]
+    if ino is None:
+        # a fresh index after rotation (or the first one): count it from the start
+        ino, position = st.st_ino, 0
+    elif ino != st.st_ino or st.st_size < position:
+        # lost track of the live index: start over from every index file
+        rebuilt = _rebuild()
+        data.clear()
+        data.update(rebuilt)
+        ino, position = st.st_ino, 0
+    if st.st_size > position:
+        with open(LOG_INDEX_PATH, "rb") as f:
+            f.seek(position)
+            raw = f.read()
+        raw = raw[:raw.rfind(b"\n") + 1]
+        _count_rows(data, raw)
+        position += len(raw)
+        _state["dirty"] = True
+    data["index"] = [ino, position]
+
+
+def _prune(data):
+    for name, (_, keep, _) in RESOLUTIONS.items():
+        buckets = data[name]
+        if len(buckets) > keep:
+            for key in sorted(buckets)[:len(buckets) - keep]:
+                del buckets[key]
+
+
+def _save(force=False):
+    # caller holds _lock
+    if not _state["dirty"] or _state["data"] is None:
+        return
+    if not force and time.monotonic() - _state["saved_at"] < SAVE_INTERVAL:
+        return
+    data = _state["data"]
+    _prune(data)
+    atomic_write(LOG_COUNTERS_PATH, json.dumps(data), fsync=False)
+    _state.update(loaded=_file_key(LOG_COUNTERS_PATH), saved_at=time.monotonic(), dirty=False)
+
+
+def update(force_save=False):
+    """Count index rows written since the last update; called by the log writer"""
+    try:
+        with _lock:
+            _catch_up(_load())
+            _save(force_save)
+    except (OSError, ValueError):
+        pass
+
+
+def rotated():
+    """The live index was archived; the next one is counted from its start"""
+    try:
+        with _lock:
+            data = _load()
+            data["index"] = [None, 0]
+            _state["dirty"] = True
+            _save(force=True)
+    except (OSError, ValueError):
+        pass
+
+
+def save():
+    try:
+        with _lock:
+            _save(force=True)
+    except Exception:
+        pass
+
+atexit.register(save)
+
+
+def _snapshot():
+    from core.logger import flush_logs
+    flush_logs()
+    with _lock:
+        data = _load()
+        _catch_up(data)
+        return {name: dict(data[name]) for name in RESOLUTIONS}
+
+
+def _resolution_for(since, until):
+    span = until - since
+    if span <= timedelta(days=1):
+        return "minute"
+    if span <= timedelta(days=30):
+        return "hour"
+    return "day"
+
+
+def totals(since, until=None):
+    """Summed counters for [since, until] (datetimes, UTC), using the finest
+    resolution that is still retained for a window of that length"""
+    until = until or datetime.utcnow()
+    resolution = _resolution_for(since, until)
+    length = RESOLUTIONS[resolution][0]
+    start = since.isoformat(sep=" ", timespec="seconds")[:length]
+    end = until.isoformat(sep=" ", timespec="seconds")[:length]
+
+    result = {"events": 0, "logins": 0, "failed_logins": 0, "security_events": 0}
+    for bucket, counts in _snapshot()[resolution].items():
+        if start <= bucket <= end:
+            for category, count in counts.items():
+                result[category] = result.get(category, 0) + count
+    return result
+
+
+def failed_login_rate(since, until=None):
+    """Failed logins per hour over the window"""
+    until = until or datetime.utcnow()
+    hours = max((until - since).total_seconds() / 3600, 1 / 60)
+    return totals(since, until)["failed_logins"] / hours
+
+
+def trend(resolution="hour", count=24, category="security_events"):
+    """[(bucket, count)] for the last count buckets, oldest first, zeros included"""
+    step = RESOLUTIONS[resolution][2]
+    buckets = _snapshot()[resolution]
+    now = datetime.utcnow()
+    result = []
+    for n in range(count - 1, -1, -1):
+        key = (now - step * n).strftime(BUCKET_FORMATS[resolution])
+        result.append((key, buckets.get(key, {}).get(category, 0)))
+    return result
@@ -0,0 +1,108 @@
+# core/file_lock.py
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only cover threads of this process
+    fcntl = None
+
+# Reader/writer locks shared by every process using the data directory. Each
+# protected file gets a sibling "<file>.lock" held with flock(): any number of
+# processes may hold it shared to read, one holds it exclusive to write.
+# Threads of one process take turns on a re-entrant lock in front of it,
+# because flock treats every open of the lock file as a separate owner.
+# Writers replace files through atomic_write, so a reader never sees a
+# half-written file even without a lock.
+
+_registry = {"pid": None, "locks": {}}
+_registry_lock = threading.Lock()
+
+
+class FileLock:
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._fd = None
+        self._depth = 0
+        self._exclusive = False
+
+    def _flock(self, exclusive):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    @contextmanager
+    def _hold(self, exclusive):
+        with self._lock:
+            upgraded = False
+            if self._depth == 0:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                try:
+                    self._flock(exclusive)
+                except BaseException:
+                    os.close(self._fd)
+                    self._fd = None
+                    raise
+                self._exclusive = exclusive
+            elif exclusive and not self._exclusive:
+                # shared -> exclusive within one thread; flock converts the lock
+                self._flock(True)
+                self._exclusive = upgraded = True
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    os.close(self._fd)  # closing releases the flock
+                    self._fd = None
+                    self._exclusive = False
+                elif upgraded:
+                    self._flock(False)
+                    self._exclusive = False
+
+    def shared(self):
+        """Hold for reading: other processes may read, none may write"""
+        return self._hold(False)
+
+    def exclusive(self):
+        """Hold for writing: no other process may read or write"""
+        return self._hold(True)
+
+
+def lock_for(path):
+    """The process-wide FileLock guarding path"""
+    with _registry_lock:
+        if _registry["pid"] != os.getpid():
+            # a forked child must not reuse locks held by its parent
+            _registry.update(pid=os.getpid(), locks={})
+        lock = _registry["locks"].get(path)
+        if lock is None:
+            lock = _registry["locks"][path] = FileLock(path + ".lock")
+        return lock
+
+
+def atomic_write(path, data, fsync=True):
+    """Replace path with data (bytes or str) via a temp file in the same directory"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -3,7 +3,8 @@ import json
 import os
 from datetime import datetime, timedelta
 from core.utils import DATA_DIR
-from core.logger import log
+from core.logger import log_event
+from core.file_lock import lock_for, atomic_write
 
 RANKS_FILE = os.path.join(DATA_DIR, "user_ranks.json")
 BADGES_FILE = os.path.join(DATA_DIR, "user_badges.json")
@@ -208,7 +209,7 @@ class GamificationSystem:
         """Load user rank and badge data"""
         if os.path.exists(RANKS_FILE):
             try:
-                with open(RANKS_FILE, 'r') as f:
+                with lock_for(RANKS_FILE).shared(), open(RANKS_FILE, 'r') as f:
                     return json.load(f)
             except:
                 return {}
@@ -217,16 +218,15 @@ class GamificationSystem:
     @staticmethod
     def save_user_data(data):
         """Save user rank and badge data"""
-        os.makedirs(os.path.dirname(RANKS_FILE), exist_ok=True)
-        with open(RANKS_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        with lock_for(RANKS_FILE).exclusive():
+            atomic_write(RANKS_FILE, json.dumps(data, indent=2))
     
     @staticmethod
     def load_badges():
         """Load user badges"""
         if os.path.exists(BADGES_FILE):
             try:
-                with open(BADGES_FILE, 'r') as f:
+                with lock_for(BADGES_FILE).shared(), open(BADGES_FILE, 'r') as f:
                     return json.load(f)
             except:
                 return {}
@@ -235,16 +235,15 @@ class GamificationSystem:
     @staticmethod
     def save_badges(data):
         """Save user badges"""
-        os.makedirs(os.path.dirname(BADGES_FILE), exist_ok=True)
-        with open(BADGES_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        with lock_for(BADGES_FILE).exclusive():
+            atomic_write(BADGES_FILE, json.dumps(data, indent=2))
     
     @staticmethod
     def load_tasks():
         """Load daily tasks completion"""
         if os.path.exists(TASKS_FILE):
             try:
-                with open(TASKS_FILE, 'r') as f:
+                with lock_for(TASKS_FILE).shared(), open(TASKS_FILE, 'r') as f:
                     return json.load(f)
             except:
                 return {}
@@ -253,9 +252,8 @@ class GamificationSystem:
     @staticmethod
     def save_tasks(data):
         """Save daily tasks completion"""
-        os.makedirs(os.path.dirname(TASKS_FILE), exist_ok=True)
-        with open(TASKS_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        with lock_for(TASKS_FILE).exclusive():
+            atomic_write(TASKS_FILE, json.dumps(data, indent=2))
     
     @staticmethod
     def get_user_rank(username):
@@ -263,18 +261,20 @@ class GamificationSystem:
         data = GamificationSystem.load_user_data()
         
         if username not in data:
-            # Initialize new user
-            data[username] = {
-                "points": 0,
-                "last_login": None,
-                "login_streak": 0,
-                "total_records": 0,
-                "total_backups": 0,
-                "total_searches": 0,
-                "total_exports": 0,
-                "first_seen": datetime.now().isoformat()
-            }
-            GamificationSystem.save_user_data(data)
+            # Initialize new user; reload under the write lock so no one else's update is lost
+            with lock_for(RANKS_FILE).exclusive():
+                data = GamificationSystem.load_user_data()
+                data.setdefault(username, {
+                    "points": 0,
+                    "last_login": None,
+                    "login_streak": 0,
+                    "total_records": 0,
+                    "total_backups": 0,
+                    "total_searches": 0,
+                    "total_exports": 0,
+                    "first_seen": datetime.now().isoformat()
+                })
+                GamificationSystem.save_user_data(data)
         
         points = data[username]["points"]
         
@@ -299,11 +299,14 @@ class GamificationSystem:
         
         if username not in tasks or tasks[username].get("date") != today:
             # Reset tasks for new day
-            tasks[username] = {
-                "date": today,
-                "completed": []
-            }
-            GamificationSystem.save_tasks(tasks)
+            with lock_for(TASKS_FILE).exclusive():
+                tasks = GamificationSystem.load_tasks()
+                if username not in tasks or tasks[username].get("date") != today:
+                    tasks[username] = {
+                        "date": today,
+                        "completed": []
+                    }
+                    GamificationSystem.save_tasks(tasks)
         
         result = []
         for task in DAILY_TASKS:
@@ -339,85 +342,83 @@ class GamificationSystem:
         
         return users[:limit]
     
-@staticmethod
-def record_event(username, event_type):
-    """Record user activity for gamification"""
-    data = GamificationSystem.load_user_data()
-    
-    if username not in data:
-        data[username] = {
-            "points": 0,
-            "last_login": None,
-            "login_streak": 0,
-            "total_records": 0,
-            "total_backups": 0,
-            "total_searches": 0,
-            "total_exports": 0,
-            "first_seen": datetime.now().isoformat()
-        }
-    
-    today = datetime.now().date()
-    
-    if event_type == "login":
-        last = data[username].get("last_login")
-        if last:
-            try:
-                last_date = datetime.fromisoformat(last).date()
-                if last_date == today - timedelta(days=1):
-                    data[username]["login_streak"] += 1
-                elif last_date < today - timedelta(days=1):
+    @staticmethod
+    def record_event(username, event_type):
+        """Record user activity for gamification"""
+        # one read-modify-write of the ranks file: badge points are added to
+        # this copy instead of being saved separately and then overwritten
+        with lock_for(RANKS_FILE).exclusive():
+            data = GamificationSystem.load_user_data()
+            
+            if username not in data:
+                data[username] = {
+                    "points": 0,
+                    "last_login": None,
+                    "login_streak": 0,
+                    "total_records": 0,
+                    "total_backups": 0,
+                    "total_searches": 0,
+                    "total_exports": 0,
+                    "first_seen": datetime.now().isoformat()
+                }
+            
+            today = datetime.now().date()
+            earned = []
+            
+            if event_type == "login":
+                last = data[username].get("last_login")
+                if last:
+                    try:
+                        last_date = datetime.fromisoformat(last).date()
+                        if last_date == today - timedelta(days=1):
+                            data[username]["login_streak"] += 1
+                        elif last_date < today - timedelta(days=1):
+                            data[username]["login_streak"] = 1
+                    except:
+                        data[username]["login_streak"] = 1
+                else:
                     data[username]["login_streak"] = 1
-            except:
-                data[username]["login_streak"] = 1
-        else:
-            data[username]["login_streak"] = 1
-        
-        data[username]["last_login"] = datetime.now().isoformat()
-        
-        # Check for streak badges
-        streak = data[username]["login_streak"]
-        if streak == 7:
-            GamificationSystem.award_badge(username, "login_streak_7")
-        elif streak == 30:
-            GamificationSystem.award_badge(username, "login_streak_30")
-        
-        # Check for time-based badges
-        hour = datetime.now().hour
-        if hour < 6:
-            GamificationSystem.award_badge(username, "night_owl")
-        elif hour < 8:
-            GamificationSystem.award_badge(username, "early_bird")
-    
-    elif event_type == "add_record":
-        data[username]["total_records"] += 1
-        count = data[username]["total_records"]
-        
-        if count == 1:
-            GamificationSystem.award_badge(username, "first_record")
-        elif count == 10:
-            GamificationSystem.award_badge(username, "record_master_10")
-        elif count == 50:
-            GamificationSystem.award_badge(username, "record_master_50")
-        elif count == 100:
-            GamificationSystem.award_badge(username, "record_master_100")
-        
-        GamificationSystem.add_points(username, 2, "Added record")
-
-        GamificationSystem.save_user_data(data)
+                
+                data[username]["last_login"] = datetime.now().isoformat()
+                
+                # Check for streak badges
+                streak = data[username]["login_streak"]
+                if streak == 7:
+                    earned.append("login_streak_7")
+                elif streak == 30:
+                    earned.append("login_streak_30")
+                
+                # Check for time-based badges
+                hour = datetime.now().hour
+                if hour < 6:
+                    earned.append("night_owl")
+                elif hour < 8:
+                    earned.append("early_bird")
+            
+            elif event_type == "add_record":
+                data[username]["total_records"] += 1
+                count = data[username]["total_records"]
+                
+                if count == 1:
+                    earned.append("first_record")
+                elif count == 10:
+                    earned.append("record_master_10")
+                elif count == 50:
+                    earned.append("record_master_50")
+                elif count == 100:
+                    earned.append("record_master_100")
+                
+                data[username]["points"] += 2
+            
+            for badge_id in earned:
+                data[username]["points"] += GamificationSystem._grant_badge(username, badge_id)
+            
+            GamificationSystem.save_user_data(data)
     
     @staticmethod
-    def award_badge(username, badge_id):
-        """Award a badge to user"""
-        badges = GamificationSystem.load_badges()
-        
-        if username not in badges:
-            badges[username] = []
-        
-        # Check if already has badge
-        for badge in badges[username]:
-            if badge["id"] == badge_id:
-                return False
-        
+    def _grant_badge(username, badge_id):
+        """Add the badge to the user's badges; returns its points, 0 if the
+        badge is unknown or already held. The points are the caller's to add."""
         # Find badge details
         badge_details = None
         for badge in BADGES:
@@ -426,43 +427,63 @@ def record_event(username, event_type):
                 break
         
         if not badge_details:
-            return False
+            return 0
         
-        # Add badge
-        badges[username].append({
-            "id": badge_id,
-            "name": badge_details["name"],
-            "description": badge_details["description"],
-            "icon": badge_details["icon"],
-            "points": badge_details["points"],
-            "awarded_at": datetime.now().isoformat()
-        })
+        with lock_for(BADGES_FILE).exclusive():
+            badges = GamificationSystem.load_badges()
+            
+            if username not in badges:
+                badges[username] = []
+            
+            # Check if already has badge
+            for badge in badges[username]:
+                if badge["id"] == badge_id:
+                    return 0
+            
+            # Add badge
+            badges[username].append({
+                "id": badge_id,
+                "name": badge_details["name"],
+                "description": badge_details["description"],
+                "icon": badge_details["icon"],
+                "points": badge_details["points"],
+                "awarded_at": datetime.now().isoformat()
+            })
+            
+            GamificationSystem.save_badges(badges)
         
-        GamificationSystem.save_badges(badges)
+        log_event("GAMIFICATION", f"earned badge {badge_details['name']}", user=username)
+        return badge_details["points"]
+    
+    @staticmethod
+    def award_badge(username, badge_id):
+        """Award a badge to user"""
+        points = GamificationSystem._grant_badge(username, badge_id)
+        if not points:
+            return False
         
         # Add points for badge
-        GamificationSystem.add_points(username, badge_details["points"], f"Badge: {badge_details['name']}")
-        
-        log(f"GAMIFICATION: {username} earned badge {badge_details['name']}")
+        GamificationSystem.add_points(username, points)
         return True
     
     @staticmethod
     def add_points(username, points, reason=""):
         """Add points to user"""
-        data = GamificationSystem.load_user_data()
-        
-        if username not in data:
-            data[username] = {
-                "points": 0,
-                "last_login": None,
-                "login_streak": 0,
-                "total_records": 0,
-                "total_backups": 0,
-                "total_searches": 0,
-                "total_exports": 0,
-                "first_seen": datetime.now().isoformat()
-            }
-        
-        data[username]["points"] += points
-        GamificationSystem.save_user_data(data)
-        return True
\ No newline at end of file
+        with lock_for(RANKS_FILE).exclusive():
+            data = GamificationSystem.load_user_data()
+            
+            if username not in data:
+                data[username] = {
+                    "points": 0,
+                    "last_login": None,
+                    "login_streak": 0,
+                    "total_records": 0,
+                    "total_backups": 0,
+                    "total_searches": 0,
+                    "total_exports": 0,
+                    "first_seen": datetime.now().isoformat()
+                }
+            
+            data[username]["points"] += points
+            GamificationSystem.save_user_data(data)
+        return True
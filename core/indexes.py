@@ -0,0 +1,275 @@
+# core/indexes.py
+
+class RecordIndex:
+    """Hash indexes on id, phone and national_id, fed by store change entries"""
+
+    def __init__(self, entries=None):
+        # id -> [phone, national_id]; the reverse maps (value -> set of ids,
+        # values need not be unique) are derived from it
+        self.entries = {}
+        self.by_phone = {}
+        self.by_national_id = {}
+        for rid, (phone, national_id) in (entries or {}).items():
+            self._insert(rid, phone, national_id)
+
+    @classmethod
+    def build(cls, records):
+        index = cls()
+        for record in records:
+            index.add(record)
+        return index
+
+    def to_dict(self):
+        return {"entries": self.entries}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("entries"))
+
+    def _insert(self, rid, phone, national_id):
+        self.entries[rid] = [phone, national_id]
+        if phone:
+            self.by_phone.setdefault(phone, set()).add(rid)
+        if national_id:
+            self.by_national_id.setdefault(national_id, set()).add(rid)
+
+    def add(self, record):
+        rid = record.get("id")
+        self.remove(rid)
+        self._insert(rid, record.get("phone"), record.get("national_id"))
+
+    def remove(self, rid):
+        old = self.entries.pop(rid, None)
+        if not old:
+            return
+        phone, national_id = old
+        for reverse, value in ((self.by_phone, phone), (self.by_national_id, national_id)):
+            ids = reverse.get(value) if value else None
+            if ids:
+                ids.discard(rid)
+                if not ids:
+                    del reverse[value]
+
+    def apply(self, entries):
+        for entry in entries:
+            if entry["op"] == "put":
+                self.add(entry["record"])
+            elif entry["op"] == "del":
+                self.remove(entry["id"])
+
+    def contains(self, rid):
+        return rid in self.entries
+
+    def phone_ids(self, phone):
+        return set(self.by_phone.get(phone, ()))
+
+    def national_id_ids(self, national_id):
+        return set(self.by_national_id.get(national_id, ()))
+
+    def find_phone(self, phone):
+        """One id with this phone (the lowest, when several share it), or None"""
+        ids = self.by_phone.get(phone)
+        return min(ids) if ids else None
+
+    def find_national_id(self, national_id):
+        ids = self.by_national_id.get(national_id)
+        return min(ids) if ids else None
+
+
+QUALITY_FIELDS = ("first_name", "last_name", "national_id", "phone", "address")
+VALID_PHONE = 1 << len(QUALITY_FIELDS)
+VALID_NATIONAL_ID = VALID_PHONE << 1
+
+
+def quality_flags(record, national_id_valid=None):
+    """Bitmask of filled QUALITY_FIELDS plus phone/national ID validity"""
+    from core.validators import DataValidator
+    flags = 0
+    for bit, field in enumerate(QUALITY_FIELDS):
+        if record.get(field):
+            flags |= 1 << bit
+    if record.get("phone") and DataValidator.validate_iranian_phone(record["phone"])[0]:
+        flags |= VALID_PHONE
+    if record.get("national_id"):
+        if national_id_valid is None:
+            national_id_valid = DataValidator.validate_national_id(record["national_id"])[0]
+        if national_id_valid:
+            flags |= VALID_NATIONAL_ID
+    return flags
+
+
+class RecordStats:
+    """Running aggregates behind get_system_stats and the analytics reports,
+    fed by store change entries"""
+
+    VERSION = 2
+
+    def __init__(self, entries=None, oldest=None, newest=None):
+        # id -> [city, created_at, quality_flags]
+        self.entries = {}
+        self.by_city = {}
+        self.filled = dict.fromkeys(QUALITY_FIELDS, 0)
+        self.valid_phones = 0
+        self.valid_national_ids = 0
+        self.oldest_id = self.newest_id = None
+        self.oldest = self.newest = None
+        for rid, row in (entries or {}).items():
+            self._insert(rid, *row)
+        if oldest and oldest.get("id") == self.oldest_id:
+            self.oldest = oldest
+        if newest and newest.get("id") == self.newest_id:
+            self.newest = newest
+
+    @classmethod
+    def build(cls, records):
+        from core.validators import DataValidator
+        records = list(records)
+        # national IDs are checked for the whole column at once
+        national_ids = DataValidator.validate_national_ids([r.get("national_id") for r in records])
+        stats = cls()
+        for record, national_id_valid in zip(records, national_ids):
+            stats.add(record, national_id_valid)
+        return stats
+
+    def to_dict(self):
+        return {"version": self.VERSION, "entries": self.entries, "oldest": self.oldest, "newest": self.newest}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("entries"), data.get("oldest"), data.get("newest"))
+
+    def _count(self, row, sign):
+        city, _, flags = row
+        self.by_city[city] = self.by_city.get(city, 0) + sign
+        if not self.by_city[city]:
+            del self.by_city[city]
+        for bit, field in enumerate(QUALITY_FIELDS):
+            if flags & (1 << bit):
+                self.filled[field] += sign
+        if flags & VALID_PHONE:
+            self.valid_phones += sign
+        if flags & VALID_NATIONAL_ID:
+            self.valid_national_ids += sign
+
+    def _insert(self, rid, city, created_at, flags):
+        self.entries[rid] = row = [city, created_at, flags]
+        self._count(row, 1)
+        # entries keep record order, so ties go to the earlier record
+        if self.oldest_id is None or created_at < self.entries[self.oldest_id][1]:
+            self.oldest_id, self.oldest = rid, None
+        if self.newest_id is None or created_at > self.entries[self.newest_id][1]:
+            self.newest_id, self.newest = rid, None
+
+    def add(self, record, national_id_valid=None):
+        rid = record.get("id")
+        row = [record.get("address", "Unknown"), record.get("created_at") or "",
+               quality_flags(record, national_id_valid)]
+        old = self.entries.get(rid)
+        if old is None:
+            self._insert(rid, *row)
+        else:
+            # edits stay in place, like the record itself
+            self._count(old, -1)
+            self.entries[rid] = row
+            self._count(row, 1)
+            if row[1] != old[1]:
+                self._rescan()
+        if self.oldest_id == rid:
+            self.oldest = dict(record)
+        if self.newest_id == rid:
+            self.newest = dict(record)
+
+    def remove(self, rid):
+        old = self.entries.pop(rid, None)
+        if not old:
+            return
+        self._count(old, -1)
+        if rid in (self.oldest_id, self.newest_id):
+            self._rescan()
+
+    def _rescan(self):
+        # only needed when an extreme may have moved; get_system_stats refetches it
+        oldest_id = newest_id = None
+        for rid, row in self.entries.items():
+            if oldest_id is None or row[1] < self.entries[oldest_id][1]:
+                oldest_id = rid
+            if newest_id is None or row[1] > self.entries[newest_id][1]:
+                newest_id = rid
+        if oldest_id != self.oldest_id:
+            self.oldest_id, self.oldest = oldest_id, None
+        if newest_id != self.newest_id:
+            self.newest_id, self.newest = newest_id, None
+
+    def apply(self, entries):
+        for entry in entries:
+            if entry["op"] == "put":
+                self.add(entry["record"])
+            elif entry["op"] == "del":
+                self.remove(entry["id"])
+
+
+TRIGRAM_FIELDS = ("first_name", "last_name", "address")
+_NO_IDS = frozenset()
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """Per-field trigram postings used to narrow substring searches"""
+
+    def __init__(self, fields=TRIGRAM_FIELDS):
+        self.fields = fields
+        self.postings = {field: {} for field in fields}
+        self.values = {}
+
+    @classmethod
+    def build(cls, records, fields=TRIGRAM_FIELDS):
+        index = cls(fields)
+        for record in records:
+            index.add(record)
+        return index
+
+    def add(self, record):
+        rid = record.get("id")
+        self.remove(rid)
+        values = tuple((record.get(field) or "").lower() for field in self.fields)
+        self.values[rid] = values
+        for field, value in zip(self.fields, values):
+            postings = self.postings[field]
+            for gram in trigrams(value):
+                postings.setdefault(gram, set()).add(rid)
+
+    def remove(self, rid):
+        values = self.values.pop(rid, None)
+        if values is None:
+            return
+        for field, value in zip(self.fields, values):
+            postings = self.postings[field]
+            for gram in trigrams(value):
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(rid)
+                    if not ids:
+                        del postings[gram]
+
+    def apply(self, entries):
+        for entry in entries:
+            if entry["op"] == "put":
+                self.add(entry["record"])
+            elif entry["op"] == "del":
+                self.remove(entry["id"])
+
+    def candidates(self, field, term):
+        """Ids whose field may contain term, or None if term is too short to narrow"""
+        grams = trigrams(term.lower())
+        if not grams:
+            return None
+        postings = self.postings[field]
+        sets = sorted((postings.get(gram, _NO_IDS) for gram in grams), key=len)
+        result = set(sets[0])
+        for ids in sets[1:]:
+            if not result:
+                break
+            result &= ids
+        return result
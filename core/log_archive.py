@@ -0,0 +1,268 @@
+# core/log_archive.py
+import os
+import re
+import gzip
+import json
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from core.utils import LOG_PATH, LOG_CHAIN_PATH, LOG_INDEX_PATH, LOG_ARCHIVE_DIR
+
+# Rotated logs are gzip archives with a small JSON index beside them (time
+# range, line count, per-event-type and per-user counts and the final chain
+# MAC), so readers can pick archives without decompressing them. The event
+# index rows (logs.idx) move along as <name>.idx.
+LINE_PATTERN = re.compile(r"^\[([^\]]+)\] ([A-Za-z_]+)")
+
+_settings = {}
+_first_stamp = {"log": None, "size": 0, "stamp": None}
+
+
+def parse_line(line):
+    """(timestamp, event_type) of a log line, or (None, None)"""
+    match = LINE_PATTERN.match(line)
+    if not match:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def _rotation_settings():
+    if not _settings:
+        from core.config_manager import get_logging_config
+        config = get_logging_config()
+        _settings["bytes"] = int(config["rotate_mb"] * 1024 * 1024)
+        _settings["age"] = timedelta(days=config["rotate_days"])
+    return _settings
+
+
+def _log_started():
+    # first entry's timestamp, cached per log file. A log only grows until it
+    # is replaced, and a replacement may reuse the inode: a log smaller than
+    # last time is a new one too.
+    try:
+        st = os.stat(LOG_PATH)
+    except OSError:
+        return None
+    key = (st.st_ino, st.st_dev)
+    if (_first_stamp["log"] != key or st.st_size < _first_stamp["size"]
+            or _first_stamp["stamp"] is None):
+        with open(LOG_PATH, "r", encoding="utf-8", errors="replace") as f:
+            _first_stamp["stamp"] = parse_line(f.readline())[0]
+        _first_stamp["log"] = key
+    _first_stamp["size"] = st.st_size
+    return _first_stamp["stamp"]
+
+
+def needs_rotation():
+    settings = _rotation_settings()
+    try:
+        if os.path.getsize(LOG_PATH) >= settings["bytes"]:
+            return True
+    except OSError:
+        return False
+    started = _log_started()
+    if not started:
+        return False
+    cutoff = (datetime.utcnow() - settings["age"]).isoformat(sep=" ", timespec="seconds")
+    return started < cutoff
+
+
+def rotate_log(chain_head=None):
+    """Compress logs.txt into the archive, index it and move its chain beside it.
+    The caller holds the log lock and starts a fresh log and chain afterwards."""
+    if not os.path.exists(LOG_PATH):
+        return None
+    os.makedirs(LOG_ARCHIVE_DIR, exist_ok=True)
+
+    name = f"logs_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+    suffix = 1
+    while os.path.exists(os.path.join(LOG_ARCHIVE_DIR, name + ".txt.gz")):
+        name = f"logs_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{suffix}"
+        suffix += 1
+    archive_path = os.path.join(LOG_ARCHIVE_DIR, name + ".txt.gz")
+
+    index = {
+        "name": name,
+        "file": name + ".txt.gz",
+        "start": None,
+        "end": None,
+        "lines": 0,
+        "events": {},
+        "users": {},
+        "chain_head": chain_head
+    }
+
+    with open(LOG_PATH, "rb") as src, gzip.open(archive_path + ".tmp", "wb") as dst:
+        for raw in src:
+            dst.write(raw)
+            index["lines"] += 1
+            stamp, event = parse_line(raw.decode("utf-8", errors="replace"))
+            if stamp:
+                index["start"] = index["start"] or stamp
+                index["end"] = stamp
+            if event:
+                index["events"][event] = index["events"].get(event, 0) + 1
+    os.replace(archive_path + ".tmp", archive_path)
+
+    if os.path.exists(LOG_CHAIN_PATH):
+        os.replace(LOG_CHAIN_PATH, os.path.join(LOG_ARCHIVE_DIR, name + ".chain"))
+    if os.path.exists(LOG_INDEX_PATH):
+        with open(LOG_INDEX_PATH, "r", encoding="utf-8") as f:
+            for row in f:
+                parts = row.rstrip("\n").split("\t")
+                if len(parts) == 5 and parts[3] != "-":
+                    index["users"][parts[3]] = index["users"].get(parts[3], 0) + 1
+        os.replace(LOG_INDEX_PATH, os.path.join(LOG_ARCHIVE_DIR, name + ".idx"))
+    with open(os.path.join(LOG_ARCHIVE_DIR, name + ".json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+
+    os.remove(LOG_PATH)
+    _first_stamp.update(log=None, size=0, stamp=None)
+    return index
+
+
+def list_archives():
+    """Archive indexes, oldest first"""
+    if not os.path.exists(LOG_ARCHIVE_DIR):
+        return []
+    archives = []
+    for f in os.listdir(LOG_ARCHIVE_DIR):
+        if f.startswith("logs_") and f.endswith(".json"):
+            try:
+                with open(os.path.join(LOG_ARCHIVE_DIR, f), "r", encoding="utf-8") as fh:
+                    archives.append(json.load(fh))
+            except (OSError, ValueError):
+                continue
+    return sorted(archives, key=lambda a: (a.get("start") or "", a["name"]))
+
+
+def _archive_matches(index, since, until, event_types):
+    if since and index.get("end") and index["end"] < since:
+        return False
+    if until and index.get("start") and index["start"] > until:
+        return False
+    if event_types and not any(index["events"].get(e) for e in event_types):
+        return False
+    return True
+
+
+def _line_matches(line, since, until, event_types):
+    if not (since or until or event_types):
+        return True
+    stamp, event = parse_line(line)
+    if since and (not stamp or stamp < since):
+        return False
+    if until and (not stamp or stamp > until):
+        return False
+    if event_types and event not in event_types:
+        return False
+    return True
+
+
+def iter_log_lines(since=None, until=None, event_types=None, archives=True):
+    """Stream log lines oldest first, opening only archives whose index
+    can contain a match; since/until are 'YYYY-MM-DD HH:MM:SS' strings"""
+    from core.logger import flush_logs
+    flush_logs()
+
+    if archives:
+        for index in list_archives():
+            if not _archive_matches(index, since, until, event_types):
+                continue
+            path = os.path.join(LOG_ARCHIVE_DIR, index["file"])
+            try:
+                with gzip.open(path, "rt", encoding="utf-8", errors="replace") as f:
+                    for line in f:
+                        if _line_matches(line, since, until, event_types):
+                            yield line
+            except OSError:
+                continue
+
+    if os.path.exists(LOG_PATH):
+        with open(LOG_PATH, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if _line_matches(line, since, until, event_types):
+                    yield line
+
+
+def tail_lines(path, count, block_size=8192):
+    """Last count lines of a file, read backwards in blocks from the end"""
+    if count <= 0:
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        # one extra newline because the file normally ends with one
+        while position > 0 and data.count(b"\n") <= count:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    lines = data.decode("utf-8", errors="replace").splitlines(keepends=True)
+    return lines[-count:]
+
+
+def recent_lines(count):
+    """Last count lines, reaching into archives only if the live log is shorter"""
+    from core.logger import flush_logs
+    flush_logs()
+
+    lines = deque(tail_lines(LOG_PATH, count) if os.path.exists(LOG_PATH) else [], maxlen=count)
+
+    for index in reversed(list_archives()):
+        if len(lines) >= count:
+            break
+        older = deque(maxlen=count - len(lines))
+        try:
+            with gzip.open(os.path.join(LOG_ARCHIVE_DIR, index["file"]), "rt", encoding="utf-8", errors="replace") as f:
+                older.extend(f)
+        except OSError:
+            continue
+        lines.extendleft(reversed(older))
+
+    return list(lines)
+
+
+def follow_log(interval=0.5, stop=None):
+    """Yield lines as they are appended to logs.txt, like tail -f.
+    Survives rotation by reopening when the file is replaced."""
+    from core.logger import flush_logs
+
+    f = None
+    inode = None
+    pending = b""
+    try:
+        while stop is None or not stop.is_set():
+            try:
+                st = os.stat(LOG_PATH)
+            except OSError:
+                st = None
+
+            if st is not None and (f is None or st.st_ino != inode or st.st_size < f.tell()):
+                if f is None:
+                    f = open(LOG_PATH, "rb")
+                    f.seek(0, os.SEEK_END)
+                else:
+                    # drain what the old file got before it was rotated away
+                    for raw in f:
+                        pending += raw
+                        if pending.endswith(b"\n"):
+                            yield pending.decode("utf-8", errors="replace")
+                            pending = b""
+                    f.close()
+                    f = open(LOG_PATH, "rb")
+                inode = st.st_ino
+
+            raw = f.readline() if f is not None else b""
+            if raw:
+                pending += raw
+                if pending.endswith(b"\n"):
+                    yield pending.decode("utf-8", errors="replace")
+                    pending = b""
+                continue
+            time.sleep(interval)
+            flush_logs()
+    finally:
+        if f is not None:
+            f.close()
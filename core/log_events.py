@@ -0,0 +1,274 @@
+# core/log_events.py
+import os
+import re
+import gzip
+import threading
+from bisect import bisect_left
+from core.utils import LOG_PATH, LOG_INDEX_PATH, LOG_ARCHIVE_DIR
+from core.file_lock import lock_for, atomic_write
+
+# Structured entries keep the plain log line readable and put the queryable
+# fields after a " | " separator:
+#   [2024-01-01 10:00:00] EDIT: edited record | user=root record=AB12CD34
+# Every written line also gets a row in logs.idx (offset, time, type, user,
+# record), so filters by event type or user never scan the log itself.
+FIELD_SEPARATOR = " | "
+LINE_PATTERN = re.compile(r"^\[([^\]]+)\] ([A-Za-z_]+)")
+LEGACY_USER = re.compile(r"\buser=(\S+)")
+LEGACY_RECORD = re.compile(r"\b(?:record|id)=(\w+)")
+
+_lock = threading.Lock()
+_live = {"key": None, "position": 0, "rows": None}
+_archived = {}
+
+
+class EventRows:
+    """Index rows in log order, with their positions keyed by event type and
+    by user so filtered queries only visit the rows they can match"""
+
+    def __init__(self, rows=()):
+        self.rows = []
+        self.by_type = {}
+        self.by_user = {}
+        self.extend(rows)
+
+    def extend(self, rows):
+        for row in rows:
+            position = len(self.rows)
+            self.rows.append(row)
+            self.by_type.setdefault(row[2], []).append(position)
+            if row[3]:
+                self.by_user.setdefault(row[3], []).append(position)
+
+    def candidates(self, event_types, user):
+        """Rows of those types and that user, in log order; other filters are
+        left to the caller"""
+        if not event_types and not user:
+            return list(self.rows)
+        positions = None
+        if event_types:
+            lists = [self.by_type.get(event_type, []) for event_type in event_types]
+            positions = lists[0] if len(lists) == 1 else sorted(p for found in lists for p in found)
+        if user:
+            mine = self.by_user.get(user, [])
+            positions = mine if positions is None else _intersect(positions, mine)
+        return [self.rows[p] for p in positions]
+
+
+def _intersect(a, b):
+    # both sorted: walk the shorter one, binary-search the longer
+    if len(a) > len(b):
+        a, b = b, a
+    found = []
+    for p in a:
+        i = bisect_left(b, p)
+        if i < len(b) and b[i] == p:
+            found.append(p)
+    return found
+
+
+def format_event(event_type, message="", user=None, record_id=None):
+    fields = []
+    if user:
+        fields.append(f"user={user}")
+    if record_id:
+        fields.append(f"record={record_id}")
+    line = f"{event_type}: {message}".rstrip()
+    if fields:
+        line += FIELD_SEPARATOR + " ".join(fields)
+    return line
+
+
+def parse_event(line):
+    """Split a log line into {timestamp, type, user, record_id, message}"""
+    match = LINE_PATTERN.match(line)
+    if not match:
+        return None
+    body = line[match.end():].lstrip(":").strip()
+    event = {"timestamp": match.group(1), "type": match.group(2), "user": None, "record_id": None}
+
+    if FIELD_SEPARATOR in body:
+        body, fields = body.rsplit(FIELD_SEPARATOR, 1)
+        for pair in fields.split():
+            key, _, value = pair.partition("=")
+            if key == "user":
+                event["user"] = value
+            elif key == "record":
+                event["record_id"] = value
+    else:
+        # entries written before structured events
+        user = LEGACY_USER.search(body)
+        record = LEGACY_RECORD.search(body)
+        event["user"] = user.group(1) if user else None
+        event["record_id"] = record.group(1) if record else None
+
+    event["message"] = body
+    return event
+
+
+def _index_row(offset, line):
+    event = parse_event(line)
+    if not event:
+        return None
+    return "\t".join((str(offset), event["timestamp"], event["type"],
+                      event["user"] or "-", event["record_id"] or "-")) + "\n"
+
+
+def index_lines(lines, start):
+    """Append index rows for lines just written to logs.txt at byte offset start"""
+    rows = []
+    offset = start
+    for line in lines:
+        row = _index_row(offset, line)
+        if row:
+            rows.append(row)
+        offset += len(line.encode("utf-8"))
+    if rows:
+        with open(LOG_INDEX_PATH, "a", encoding="utf-8") as f:
+            f.write("".join(rows))
+
+
+def rebuild_index():
+    """Index an existing logs.txt from scratch (logs written before the index existed)"""
+    rows = []
+    if os.path.exists(LOG_PATH):
+        offset = 0
+        with open(LOG_PATH, "rb") as f:
+            for raw in f:
+                row = _index_row(offset, raw.decode("utf-8", errors="replace"))
+                if row:
+                    rows.append(row)
+                offset += len(raw)
+    atomic_write(LOG_INDEX_PATH, "".join(rows), fsync=False)
+
+
+def _parse_rows(text):
+    rows = []
+    for row in text.splitlines():
+        parts = row.split("\t")
+        if len(parts) != 5:
+            continue
+        offset, stamp, event_type, user, record_id = parts
+        rows.append((int(offset), stamp, event_type,
+                     None if user == "-" else user, None if record_id == "-" else record_id))
+    return rows
+
+
+def _live_rows():
+    # caller holds _lock; new rows are read from where the last call stopped
+    if os.path.exists(LOG_PATH) and not os.path.exists(LOG_INDEX_PATH):
+        from core.secure_logger import SecureLogger
+        with SecureLogger._lock, lock_for(LOG_PATH).exclusive():
+            if not os.path.exists(LOG_INDEX_PATH):
+                rebuild_index()
+    try:
+        st = os.stat(LOG_INDEX_PATH)
+    except OSError:
+        return EventRows()
+    if _live["key"] != st.st_ino or st.st_size < _live["position"]:
+        _live.update(key=st.st_ino, position=0, rows=EventRows())
+    if st.st_size > _live["position"]:
+        with open(LOG_INDEX_PATH, "rb") as f:
+            f.seek(_live["position"])
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        _live["rows"].extend(_parse_rows(data[:end].decode("utf-8")))
+        _live["position"] += end
+    return _live["rows"]
+
+
+def _archive_rows(name):
+    if name not in _archived:
+        path = os.path.join(LOG_ARCHIVE_DIR, name + ".idx")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                _archived[name] = EventRows(_parse_rows(f.read()))
+        except OSError:
+            _archived[name] = EventRows()
+    return _archived[name]
+
+
+def _row_matches(row, event_types, user, record_id, since, until):
+    _, stamp, event_type, row_user, row_record = row
+    if event_types and event_type not in event_types:
+        return False
+    if user and row_user != user:
+        return False
+    if record_id and row_record != record_id:
+        return False
+    if since and stamp < since:
+        return False
+    if until and stamp > until:
+        return False
+    return True
+
+
+def query_events(event_types=None, user=None, record_id=None, since=None, until=None, archives=True):
+    """Matching events oldest first, answered from the indexes alone;
+    since/until are 'YYYY-MM-DD HH:MM:SS' strings"""
+    from core.logger import flush_logs
+    from core.log_archive import list_archives
+    flush_logs()
+
+    if isinstance(event_types, str):
+        event_types = {event_types}
+    results = []
+
+    if archives:
+        for index in list_archives():
+            if since and index.get("end") and index["end"] < since:
+                continue
+            if until and index.get("start") and index["start"] > until:
+                continue
+            if event_types and not any(index["events"].get(e) for e in event_types):
+                continue
+            if user and "users" in index and not index["users"].get(user):
+                continue
+            for row in _archive_rows(index["name"]).candidates(event_types, user):
+                if _row_matches(row, event_types, user, record_id, since, until):
+                    results.append(_event(row, index["file"]))
+
+    with _lock:
+        # the live rows keep growing, so take this call's share under the lock
+        rows = _live_rows().candidates(event_types, user)
+    for row in rows:
+        if _row_matches(row, event_types, user, record_id, since, until):
+            results.append(_event(row, None))
+    return results
+
+
+def _event(row, archive):
+    offset, stamp, event_type, user, record_id = row
+    return {"timestamp": stamp, "type": event_type, "user": user, "record_id": record_id,
+            "offset": offset, "archive": archive}
+
+
+def event_lines(events):
+    """Full log lines for events from query_events, read by offset"""
+    lines = []
+    by_source = {}
+    for event in events:
+        by_source.setdefault(event["archive"], []).append(event["offset"])
+
+    for archive, offsets in by_source.items():
+        try:
+            if archive is None:
+                f = open(LOG_PATH, "rb")
+            else:
+                f = gzip.open(os.path.join(LOG_ARCHIVE_DIR, archive), "rb")
+        except OSError:
+            continue
+        with f:
+            for offset in sorted(offsets):
+                f.seek(offset)
+                lines.append(f.readline().decode("utf-8", errors="replace"))
+    return lines
+
+
+def count_by_user(since=None, event_types=None):
+    """{user: event count} straight from the indexes"""
+    counts = {}
+    for event in query_events(event_types=event_types, since=since):
+        if event["user"]:
+            counts[event["user"]] = counts.get(event["user"], 0) + 1
+    return counts
@@ -1,17 +1,104 @@
 # core/logger.py
 import os
+import time
+import queue
+import atexit
+import threading
 from core.utils import LOG_PATH, timestamp
 
+# Events are stamped by the caller and handed to a background writer, which
+# appends them in batches; callers never wait on log file I/O unless the
+# queue is full.
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 500
+
 def ensure_log():
     d = os.path.dirname(LOG_PATH)
     os.makedirs(d, exist_ok=True)
     if not os.path.exists(LOG_PATH):
         open(LOG_PATH, "w", encoding="utf-8").close()
 
+
+class LogWriter:
+
+    def __init__(self):
+        from core.config_manager import get_logging_config
+        config = get_logging_config()
+        self.fsync = config["fsync"]
+        self.fsync_interval = config["fsync_interval"]
+        self.last_sync = time.monotonic()
+        self.pid = os.getpid()
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def put(self, line):
+        try:
+            self.queue.put(line, timeout=1)
+        except queue.Full:
+            # writer is stuck or far behind, don't lose the event
+            self._write([line])
+
+    def flush(self):
+        """Block until everything queued so far is on disk"""
+        if self.thread.is_alive():
+            self.queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def _should_sync(self):
+        if self.fsync == "always":
+            return True
+        if self.fsync == "interval" and time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.last_sync = time.monotonic()
+            return True
+        return False
+
+    def _write(self, lines):
+        from core.secure_logger import SecureLogger
+        try:
+            SecureLogger.append_lines(lines, fsync=self._should_sync())
+        except Exception:
+            pass
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def _get_writer():
+    global _writer
+    writer = _writer
+    if writer is not None and writer.pid == os.getpid():
+        return writer
+    with _writer_lock:
+        # threads don't survive fork, so a forked worker starts its own writer
+        if _writer is None or _writer.pid != os.getpid():
+            _writer = LogWriter()
+        return _writer
+
 def log(event):
     try:
-        ensure_log()
-        with open(LOG_PATH, "a", encoding="utf-8") as f:
-            f.write(f"[{timestamp()}] {event}\n")
+        _get_writer().put(f"[{timestamp()}] {event}\n")
     except Exception:
         pass
+
+def log_event(event_type, message="", user=None, record_id=None):
+    """Log a structured event; user and record_id go into the event index"""
+    from core.log_events import format_event
+    log(format_event(event_type, message, user=user, record_id=record_id))
+
+def flush_logs():
+    if _writer is not None and _writer.pid == os.getpid():
+        _writer.flush()
+
+atexit.register(flush_logs)
@@ -0,0 +1,162 @@
+# core/login_throttle.py
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from core.config_manager import get_auth_config
+from core.file_lock import lock_for, atomic_write
+from core.utils import THROTTLE_PATH
+
+# Every login attempt takes a token from the bucket of its username and of its
+# client address; a bucket holds "attempts" tokens and refills that many per
+# window. An empty bucket turns the attempt away before any bcrypt work is
+# done. The buckets live in one locked file shared by the CLI and every web
+# worker, so the limits hold for the whole installation, not per process.
+# Password checks themselves run on a small dedicated pool with a short
+# queue, so a burst of logins cannot take more than check_threads cores.
+MAX_BUCKETS = 10000
+QUEUE_PER_THREAD = 4
+BUSY_RETRY = 1.0
+
+
+class LoginBusy(Exception):
+    """The password-check queue is full; the attempt was turned away unchecked"""
+
+
+class TokenBucket:
+
+    __slots__ = ("capacity", "rate", "tokens", "updated", "blocked")
+
+    def __init__(self, capacity, window, now, tokens=None, blocked=False):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.tokens = float(capacity if tokens is None else min(tokens, capacity))
+        self.updated = now
+        self.blocked = blocked
+
+    def refill(self, now):
+        # wall-clock time is shared between processes; never refill backwards
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, now):
+        """Seconds until the next token; 0 if one is available"""
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class LoginThrottle:
+
+    def __init__(self, user_attempts, ip_attempts, window, path=THROTTLE_PATH):
+        self.limits = {"user": max(1, user_attempts), "ip": max(1, ip_attempts)}
+        self.window = max(1, window)
+        self.path = path
+
+    def _load(self):
+        # caller holds the file lock; an unreadable file just means fresh buckets
+        buckets = {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return buckets
+        for row in rows:
+            try:
+                kind, key, tokens, updated, blocked = row
+                buckets[(kind, key)] = TokenBucket(self.limits[kind], self.window, updated, tokens, blocked)
+            except (KeyError, TypeError, ValueError):
+                continue
+        return buckets
+
+    def _save(self, buckets, now):
+        # a full bucket is the same as no bucket
+        rows = []
+        for (kind, key), bucket in buckets.items():
+            bucket.refill(now)
+            if bucket.tokens < bucket.capacity:
+                rows.append([kind, key, bucket.tokens, bucket.updated, bucket.blocked])
+        atomic_write(self.path, json.dumps(rows[-MAX_BUCKETS:]), fsync=False)
+
+    def _bucket(self, buckets, kind, key, now):
+        bucket = buckets.get((kind, key))
+        if bucket is None:
+            bucket = buckets[(kind, key)] = TokenBucket(self.limits[kind], self.window, now)
+        return bucket
+
+    def acquire(self, username, client=None):
+        """(wait, first): wait is 0 when the attempt may go ahead (it is then
+        counted), otherwise the seconds until it may; first marks the first
+        refusal since the bucket last had a token"""
+        now = time.time()
+        with lock_for(self.path).exclusive():
+            state = self._load()
+            buckets = [self._bucket(state, "user", username or "", now)]
+            if client:
+                buckets.append(self._bucket(state, "ip", client, now))
+            wait = max(bucket.wait_time(now) for bucket in buckets)
+            if wait > 0:
+                first = not any(bucket.blocked for bucket in buckets)
+                for bucket in buckets:
+                    if bucket.tokens < 1:
+                        bucket.blocked = True
+                result = wait, first
+            else:
+                for bucket in buckets:
+                    bucket.tokens -= 1
+                    bucket.blocked = False
+                result = 0.0, False
+            self._save(state, now)
+            return result
+
+    def refund(self, username, client=None):
+        """Give back the token acquire() took for an attempt that never ran"""
+        now = time.time()
+        with lock_for(self.path).exclusive():
+            state = self._load()
+            for key in (("user", username or ""), ("ip", client)):
+                bucket = state.get(key)
+                if bucket is not None:
+                    bucket.refill(now)
+                    bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+            self._save(state, now)
+
+
+_state = {"pid": None, "throttle": None, "pool": None, "slots": None}
+_state_lock = threading.Lock()
+
+
+def _runtime():
+    with _state_lock:
+        # pools don't survive fork: each web worker sets up its own
+        if _state["pid"] != os.getpid():
+            config = get_auth_config()
+            threads = max(1, int(config["check_threads"]))
+            _state.update(
+                pid=os.getpid(),
+                throttle=LoginThrottle(int(config["user_attempts"]), int(config["ip_attempts"]),
+                                       float(config["window_seconds"])),
+                pool=ThreadPoolExecutor(max_workers=threads, thread_name_prefix="datana-login"),
+                slots=threading.BoundedSemaphore(threads * QUEUE_PER_THREAD),
+            )
+        return _state
+
+
+def acquire(username, client=None):
+    return _runtime()["throttle"].acquire(username, client)
+
+
+def refund(username, client=None):
+    _runtime()["throttle"].refund(username, client)
+
+
+def run_check(fn, *args):
+    """fn(*args) run on the password-check pool; raises LoginBusy when its
+    queue is already full"""
+    state = _runtime()
+    if not state["slots"].acquire(blocking=False):
+        raise LoginBusy()
+    try:
+        return state["pool"].submit(fn, *args).result()
+    finally:
+        state["slots"].release()
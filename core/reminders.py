@@ -3,6 +3,7 @@ import json
 import os
 from datetime import datetime, timedelta
 from core.utils import DATA_DIR
+from core.file_lock import lock_for, atomic_write
 
 REMINDERS_FILE = os.path.join(DATA_DIR, "reminders.json")
 
@@ -11,7 +12,7 @@ class ReminderSystem:
     def load_reminders():
         if os.path.exists(REMINDERS_FILE):
             try:
-                with open(REMINDERS_FILE, 'r', encoding='utf-8') as f:
+                with lock_for(REMINDERS_FILE).shared(), open(REMINDERS_FILE, 'r', encoding='utf-8') as f:
                     return json.load(f)
             except:
                 return []
@@ -19,26 +20,26 @@ class ReminderSystem:
     
     @staticmethod
     def save_reminders(reminders):
-        os.makedirs(os.path.dirname(REMINDERS_FILE), exist_ok=True)
-        with open(REMINDERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(reminders, f, indent=2)
+        with lock_for(REMINDERS_FILE).exclusive():
+            atomic_write(REMINDERS_FILE, json.dumps(reminders, indent=2))
     
     @staticmethod
     def add_reminder(text, days=0, hours=0, minutes=0):
-        reminders = ReminderSystem.load_reminders()
-        
-        due_time = datetime.now() + timedelta(days=days, hours=hours, minutes=minutes)
-        
-        reminder = {
-            "id": len(reminders) + 1,
-            "text": text,
-            "created": datetime.now().isoformat(),
-            "due": due_time.isoformat(),
-            "completed": False
-        }
-        
-        reminders.append(reminder)
-        ReminderSystem.save_reminders(reminders)
+        with lock_for(REMINDERS_FILE).exclusive():
+            reminders = ReminderSystem.load_reminders()
+            
+            due_time = datetime.now() + timedelta(days=days, hours=hours, minutes=minutes)
+            
+            reminder = {
+                "id": len(reminders) + 1,
+                "text": text,
+                "created": datetime.now().isoformat(),
+                "due": due_time.isoformat(),
+                "completed": False
+            }
+            
+            reminders.append(reminder)
+            ReminderSystem.save_reminders(reminders)
         return reminder["id"]
     
     @staticmethod
@@ -56,13 +57,14 @@ class ReminderSystem:
     
     @staticmethod
     def complete_reminder(reminder_id):
-        reminders = ReminderSystem.load_reminders()
-        
-        for reminder in reminders:
-            if reminder["id"] == reminder_id:
-                reminder["completed"] = True
-                ReminderSystem.save_reminders(reminders)
-                return True
+        with lock_for(REMINDERS_FILE).exclusive():
+            reminders = ReminderSystem.load_reminders()
+            
+            for reminder in reminders:
+                if reminder["id"] == reminder_id:
+                    reminder["completed"] = True
+                    ReminderSystem.save_reminders(reminders)
+                    return True
         
         return False
     
@@ -1,93 +1,275 @@
 # core/secure_logger.py
 import os
+import json
 import hashlib
 import hmac
-from core.utils import LOG_PATH, timestamp
-from core.config_manager import get_encryption_key
+import threading
+from core.utils import LOG_PATH, LOG_CHAIN_PATH, LOG_CHECKPOINT_PATH, LOG_INDEX_PATH, timestamp
+from core.config_manager import get_log_mac_key
+from core.file_lock import lock_for, atomic_write
+from core import log_archive, log_events, event_counters
+
+# Integrity is an HMAC chain kept next to the log: each link seals the log bytes
+# written since the previous link together with that link's MAC. Appends cost
+# one HMAC over the new line; editing, dropping or truncating sealed bytes
+# breaks every later link. Every process appending to the log (CLI, web
+# workers) seals under the same file lock, so links never interleave.
+GENESIS_MAC = "0" * 64
 
 class SecureLogger:
     
+    _lock = threading.Lock()
+    _head = {"chain": None, "link": None}
+    
     @staticmethod
     def ensure_secure_log():
+        """Lines a fresh log must start with; they are sealed with the first append"""
         log_dir = os.path.dirname(LOG_PATH)
         os.makedirs(log_dir, exist_ok=True)
         
-        if not os.path.exists(LOG_PATH):
-            with open(LOG_PATH, 'w', encoding='utf-8') as f:
-                f.write(f"[{timestamp()}] SECURE_LOG: Log system initialized\n")
+        if os.path.exists(LOG_PATH):
+            return []
+        # a fresh log starts a fresh chain
+        SecureLogger._reset_chain()
+        if os.path.exists(LOG_INDEX_PATH):
+            os.remove(LOG_INDEX_PATH)
+        return [f"[{timestamp()}] SECURE_LOG: Log system initialized\n"]
+    
+    @staticmethod
+    def _evidence_path(path):
+        target = path + ".broken"
+        suffix = 1
+        while os.path.exists(target):
+            target = f"{path}.broken.{suffix}"
+            suffix += 1
+        return target
+    
+    @staticmethod
+    def _set_aside(reason):
+        """Move a log that no longer matches its chain (and the chain) aside as
+        evidence; returns the alert line the fresh log starts with"""
+        event_counters.update(force_save=True)
+        evidence = SecureLogger._evidence_path(LOG_PATH)
+        os.replace(LOG_PATH, evidence)
+        if os.path.exists(LOG_CHAIN_PATH):
+            os.replace(LOG_CHAIN_PATH, SecureLogger._evidence_path(LOG_CHAIN_PATH))
+        if os.path.exists(LOG_INDEX_PATH):
+            os.remove(LOG_INDEX_PATH)
+        SecureLogger._reset_chain()
+        event_counters.rotated()
+        return (f"[{timestamp()}] SECURITY_ALERT: Log file integrity compromised - {reason}; "
+                f"previous log kept as {os.path.basename(evidence)}\n")
+    
+    @staticmethod
+    def _rotate(chain_head):
+        event_counters.update(force_save=True)
+        log_archive.rotate_log(chain_head)
+        SecureLogger._reset_chain()
+        event_counters.rotated()
+    
+    @staticmethod
+    def _reset_chain():
+        for path in (LOG_CHAIN_PATH, LOG_CHECKPOINT_PATH):
+            if os.path.exists(path):
+                os.remove(path)
+        SecureLogger._head.update(chain=None, link=None)
+    
+    @staticmethod
+    def _mac(previous, data):
+        return hmac.new(get_log_mac_key(), previous.encode() + data, hashlib.sha256).hexdigest()
+    
+    @staticmethod
+    def _chain_head():
+        """(log_offset, mac) of the newest link, read from the end of the chain file"""
+        try:
+            st = os.stat(LOG_CHAIN_PATH)
+        except OSError:
+            return 0, GENESIS_MAC
+        if not st.st_size:
+            return 0, GENESIS_MAC
+        # another process may have rotated in a new chain of the same size
+        key = (st.st_ino, st.st_dev, st.st_size, st.st_mtime_ns)
+        if SecureLogger._head["chain"] == key:
+            return SecureLogger._head["link"]
+        
+        with open(LOG_CHAIN_PATH, 'rb') as f:
+            f.seek(max(0, st.st_size - 256))
+            tail = f.read()
+        offset, mac = tail.rstrip(b"\n").rsplit(b"\n", 1)[-1].decode().split()
+        link = (int(offset), mac)
+        SecureLogger._head.update(chain=key, link=link)
+        return link
     
     @staticmethod
     def calculate_log_hash():
-
+        """MAC at the head of the chain; it covers every sealed byte of the log"""
         if not os.path.exists(LOG_PATH):
             return None
         
         try:
-            with open(LOG_PATH, 'rb') as f:
-                content = f.read()
-            
-            #HMAC Encryption
-            key = get_encryption_key()
-            log_hash = hmac.new(key, content, hashlib.sha256).hexdigest()
-            return log_hash
+            with SecureLogger._lock, lock_for(LOG_PATH).shared():
+                return SecureLogger._chain_head()[1]
         except Exception:
             return None
     
     @staticmethod
     def secure_log(event):
         try:
-            SecureLogger.ensure_secure_log()
+            SecureLogger.append_lines([f"[{timestamp()}] {event}\n"])
+        except Exception as e:
             
-            current_hash = SecureLogger.calculate_log_hash()
+            pass
+    
+    @staticmethod
+    def append_lines(lines, fsync=False):
+        """Append formatted lines in one write and seal them with a single link.
+        Only bytes written here are ever sealed: a log that grew or shrank
+        behind the chain's back is set aside as tampered with."""
+        with SecureLogger._lock, lock_for(LOG_PATH).exclusive():
+            if os.path.exists(LOG_PATH):
+                size = os.path.getsize(LOG_PATH)
+                offset = SecureLogger._chain_head()[0]
+                alert = None
+                if not os.path.exists(LOG_CHAIN_PATH):
+                    if size:
+                        # written before the chain existed: archived as it is
+                        SecureLogger._rotate(None)
+                elif size < offset:
+                    alert = SecureLogger._set_aside(f"sealed entries truncated at byte {size}")
+                elif size > offset:
+                    alert = SecureLogger._set_aside(f"unsealed data after byte {offset}")
+                elif log_archive.needs_rotation():
+                    SecureLogger._rotate(SecureLogger._chain_head()[1])
+                if alert:
+                    lines = [alert] + list(lines)
+            lines = SecureLogger.ensure_secure_log() + list(lines)
+            if not lines:
+                return
             
-            with open(LOG_PATH, 'a', encoding='utf-8') as f:
-                f.write(f"[{timestamp()}] {event}\n")
+            payload = "".join(lines).encode('utf-8')
+            offset, previous = SecureLogger._chain_head()
             
-            new_hash = SecureLogger.calculate_log_hash()
+            with open(LOG_PATH, 'ab') as f:
+                start = f.tell()
+                f.write(payload)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            end = start + len(payload)
             
-            if current_hash and current_hash != new_hash:
-                with open(LOG_PATH, 'a', encoding='utf-8') as f:
-                    f.write(f"[{timestamp()}] SECURITY_ALERT: Log file integrity compromised\n")
+            log_events.index_lines(lines, start)
+            event_counters.update()
             
-        except Exception as e:
-
-            pass
+            mac = SecureLogger._mac(previous, payload)
+            with open(LOG_CHAIN_PATH, 'ab') as f:
+                f.write(f"{end} {mac}\n".encode())
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+                st = os.fstat(f.fileno())
+            SecureLogger._head.update(chain=(st.st_ino, st.st_dev, st.st_size, st.st_mtime_ns), link=(end, mac))
     
     @staticmethod
-    def verify_log_integrity():
+    def _load_checkpoint():
+        """(chain_position, log_offset, mac) of the last verified link, or the chain start"""
+        start = (0, 0, GENESIS_MAC)
+        if not os.path.exists(LOG_CHECKPOINT_PATH):
+            return start
+        try:
+            with open(LOG_CHECKPOINT_PATH, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            position, offset, mac = data["position"], data["offset"], data["mac"]
+            expected = SecureLogger._mac(mac, f"{position}:{offset}".encode())
+            if not hmac.compare_digest(expected, data["sig"]):
+                return start
+            if position > (os.path.getsize(LOG_CHAIN_PATH) if os.path.exists(LOG_CHAIN_PATH) else 0):
+                return start
+            return position, offset, mac
+        except Exception:
+            return start
+    
+    @staticmethod
+    def _save_checkpoint(position, offset, mac):
+        data = {
+            "position": position,
+            "offset": offset,
+            "mac": mac,
+            "sig": SecureLogger._mac(mac, f"{position}:{offset}".encode())
+        }
+        atomic_write(LOG_CHECKPOINT_PATH, json.dumps(data), fsync=False)
+    
+    @staticmethod
+    def verify_log_integrity(full=False):
+        """Walk the chain in one streaming pass; by default resume from the
+        last verified checkpoint instead of the start of the log"""
         if not os.path.exists(LOG_PATH):
             return True, "Log file doesn't exist"
         
+        if os.path.exists(LOG_PATH + ".broken") or os.path.exists(LOG_CHAIN_PATH + ".broken"):
+            return False, "Log integrity compromised - a tampered log was set aside"
+        
         try:
-            current_hash = SecureLogger.calculate_log_hash()
+            with SecureLogger._lock, lock_for(LOG_PATH).shared():
+                position, offset, previous = (0, 0, GENESIS_MAC) if full else SecureLogger._load_checkpoint()
+                log_size = os.path.getsize(LOG_PATH)
+                checked = 0
+                
+                if os.path.exists(LOG_CHAIN_PATH):
+                    with open(LOG_CHAIN_PATH, 'rb') as chain, open(LOG_PATH, 'rb') as f:
+                        chain.seek(position)
+                        f.seek(offset)
+                        for raw in chain:
+                            if not raw.endswith(b"\n"):
+                                break
+                            end, mac = raw.decode().split()
+                            end = int(end)
+                            if end < offset or end > log_size:
+                                return False, f"Log integrity compromised - log truncated near byte {offset}"
+                            data = f.read(end - offset)
+                            if not hmac.compare_digest(SecureLogger._mac(previous, data), mac):
+                                return False, f"Log integrity compromised - entry modified near byte {offset}"
+                            position += len(raw)
+                            offset, previous = end, mac
+                            checked += 1
+                    
+                    SecureLogger._save_checkpoint(position, offset, previous)
+                
+                if offset != log_size:
+                    return False, f"Log integrity compromised - unsealed data after byte {offset}"
             
-            with open(LOG_PATH, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            with open(LOG_PATH, 'rb') as f:
+                f.seek(max(0, log_size - 512))
+                lines = f.read().decode('utf-8', errors='replace').splitlines()
                 if lines and 'SECURITY_ALERT' in lines[-1]:
                     return False, "Log integrity compromised - security alert detected"
             
-            return True, "Log integrity verified"
-            
+            return True, f"Log integrity verified ({checked} new entries checked)"
+        
         except Exception as e:
             return False, f"Integrity check failed: {e}"
     
     @staticmethod
     def get_log_stats():
+        from core.logger import flush_logs
+        flush_logs()
+        
         if not os.path.exists(LOG_PATH):
             return {"size": 0, "lines": 0, "integrity": "No log file"}
         
         try:
             size = os.path.getsize(LOG_PATH)
-            with open(LOG_PATH, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
+            with open(LOG_PATH, 'rb') as f:
+                line_count = sum(1 for _ in f)
+            last = log_archive.recent_lines(1)
             
             integrity_status, integrity_msg = SecureLogger.verify_log_integrity()
             
             return {
                 "size": f"{size / 1024:.1f} KB",
-                "lines": len(lines),
+                "lines": line_count,
+                "archives": len(log_archive.list_archives()),
                 "integrity": integrity_msg,
-                "last_entry": lines[-1].strip() if lines else "No entries"
+                "last_entry": last[-1].strip() if last else "No entries"
             }
         except Exception:
-            return {"size": "Unknown", "lines": 0, "integrity": "Error reading log"}
\ No newline at end of file
+            return {"size": "Unknown", "lines": 0, "integrity": "Error reading log"}
@@ -0,0 +1,435 @@
+# core/storage.py
+import os, json, threading
+from cryptography.fernet import InvalidToken
+from core.utils import STORE_DIR, RECORDS_PATH
+from core.config_manager import get_fernet
+from core.indexes import RecordIndex, RecordStats
+from core.file_lock import lock_for, atomic_write
+from core.logger import log_event
+
+# Records live in encrypted fixed-size segments plus an append-only change log.
+# Every write is one log entry; the compactor later folds the log back into
+# the segments it touches, so no write ever re-encrypts the whole dataset.
+# store.lock is shared by readers and taken exclusively by writers, across
+# every process using the directory.
+SEGMENT_SIZE = 1000
+COMPACT_LOG_BYTES = 256 * 1024
+
+MANIFEST_NAME = "manifest.enc"
+LOG_NAME = "changes.log"
+INDEX_NAME = "indexes.enc"
+
+
+class SegmentStore:
+
+    def __init__(self, directory=STORE_DIR, segment_size=SEGMENT_SIZE, compact_log_bytes=COMPACT_LOG_BYTES):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compact_log_bytes = compact_log_bytes
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.log_path = os.path.join(directory, LOG_NAME)
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self._lock_path = os.path.join(directory, "store")
+        self._compactor = None
+
+    # ========== Files ==========
+
+    def _segment_path(self, seg_id):
+        return os.path.join(self.directory, f"seg_{seg_id:05d}.enc")
+
+    def _fernet(self):
+        return get_fernet()
+
+    def _shared(self):
+        return lock_for(self._lock_path).shared()
+
+    def _exclusive(self):
+        return lock_for(self._lock_path).exclusive()
+
+    def read_lock(self):
+        self.ensure()
+        return self._shared()
+
+    def write_lock(self):
+        """Hold the store for a read-modify-write: no other process or thread
+        reads or writes until the block ends; store calls inside it nest"""
+        self.ensure()
+        return self._exclusive()
+
+    def _read_encrypted(self, path, default):
+        if not os.path.exists(path):
+            return default
+        with open(path, "rb") as f:
+            token = f.read()
+        return json.loads(self._fernet().decrypt(token).decode())
+
+    def _write_encrypted(self, path, obj):
+        data = json.dumps(obj, ensure_ascii=False).encode()
+        atomic_write(path, self._fernet().encrypt(data))
+
+    def ensure(self):
+        """Create the store directory and migrate a legacy records.enc once"""
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            return
+        with self._exclusive():
+            if os.path.exists(self.manifest_path):
+                return
+            legacy = self._read_encrypted(RECORDS_PATH, None) if os.path.exists(RECORDS_PATH) else None
+            self.replace_all(legacy or [])
+            if legacy is not None:
+                os.replace(RECORDS_PATH, RECORDS_PATH + ".migrated")
+
+    def exists(self):
+        return os.path.exists(self.manifest_path) or os.path.exists(RECORDS_PATH)
+
+    def disk_size(self):
+        if not os.path.exists(self.directory):
+            return 0
+        return sum(os.path.getsize(os.path.join(self.directory, f))
+                   for f in os.listdir(self.directory) if not f.endswith(".tmp"))
+
+    # ========== Manifest & segments ==========
+
+    def load_manifest(self):
+        manifest = self._read_encrypted(self.manifest_path, None)
+        if manifest is None:
+            manifest = {"version": 1, "segments": [], "next_segment": 0, "locations": {}}
+        return manifest
+
+    def load_segment(self, seg_id):
+        return self._read_encrypted(self._segment_path(seg_id), [])
+
+    # ========== Index checkpoint ==========
+    # The index file (lookup index plus running stats) is a snapshot tied to one
+    # manifest and log offset; readers catch up by replaying the log past it.
+
+    def load_index(self, manifest_stat=None):
+        """Return (RecordIndex, RecordStats, log_offset) if the checkpoint matches the manifest"""
+        if manifest_stat is None:
+            manifest_stat = _stat(self.manifest_path)
+        try:
+            with self._shared():
+                data = self._read_encrypted(self.index_path, None)
+        except Exception:
+            return None
+        if (not data or "stats" not in data or manifest_stat is None
+                or data["stats"].get("version") != RecordStats.VERSION
+                or tuple(data["manifest"]) != manifest_stat):
+            return None
+        return RecordIndex.from_dict(data["index"]), RecordStats.from_dict(data["stats"]), data["offset"]
+
+    def save_index(self, index, stats, manifest_stat, offset):
+        with self._exclusive():
+            self._write_encrypted(self.index_path, {
+                "manifest": list(manifest_stat),
+                "offset": offset,
+                "index": index.to_dict(),
+                "stats": stats.to_dict()
+            })
+
+    # ========== Change log ==========
+
+    def read_log(self):
+        return self.read_log_from(0)[0]
+
+    def read_log_from(self, offset):
+        """Decrypt log entries after a byte offset; returns (entries, end_offset)"""
+        if not os.path.exists(self.log_path):
+            return [], 0
+        fernet = self._fernet()
+        entries = []
+        with self._shared(), open(self.log_path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # only whole lines count, a concurrent writer may still be mid-line
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entries.append(json.loads(fernet.decrypt(line).decode()))
+            except (InvalidToken, ValueError):
+                # torn write at the tail of the log
+                continue
+        return entries, offset + end
+
+    def signature(self):
+        """Cheap (manifest, log) stat pair used to detect changes from any process"""
+        return _stat(self.manifest_path), _stat(self.log_path)
+
+    def _append_log(self, entries):
+        fernet = self._fernet()
+        payload = b"".join(
+            fernet.encrypt(json.dumps(e, ensure_ascii=False).encode()) + b"\n" for e in entries
+        )
+        with open(self.log_path, "ab") as fh:
+            fh.write(payload)
+        self._maybe_compact()
+
+    # ========== Reads ==========
+
+    def load_all(self):
+        return self.snapshot()[0]
+
+    def snapshot(self):
+        """Load every record; also returns the manifest stat and log offset it reflects"""
+        self.ensure()
+        with self._shared():
+            manifest_stat = _stat(self.manifest_path)
+            manifest = self.load_manifest()
+            records = []
+            for seg_id in manifest["segments"]:
+                records.extend(self.load_segment(seg_id))
+            entries, offset = self.read_log_from(0)
+        return apply_changes(records, entries), manifest_stat, offset
+
+    def iter_records(self):
+        """Yield records one segment at a time, with the change log applied.
+        The store lock is held only while a segment is read, never across a
+        yield, so a slow consumer (a streamed download) does not stall writers.
+        If the store is compacted or rewritten mid-way, the rest comes from a
+        fresh snapshot, skipping records already yielded."""
+        self.ensure()
+        with self._shared():
+            manifest_stat = _stat(self.manifest_path)
+            manifest = self.load_manifest()
+            entries = self.read_log()
+        in_segments = manifest["locations"]
+        overrides = {}
+        tail = {}
+        for entry in entries:
+            if entry["op"] == "put":
+                rid = entry["record"].get("id")
+                if rid in tail or rid not in in_segments or overrides.get(rid, True) is None:
+                    tail[rid] = entry["record"]
+                else:
+                    overrides[rid] = entry["record"]
+            elif entry["op"] == "del":
+                if entry["id"] in tail:
+                    del tail[entry["id"]]
+                elif entry["id"] in in_segments:
+                    overrides[entry["id"]] = None
+        seen = set()
+        for seg_id in manifest["segments"]:
+            with self._shared():
+                # segments are only rewritten together with the manifest
+                rows = self.load_segment(seg_id) if _stat(self.manifest_path) == manifest_stat else None
+            if rows is None:
+                for record in self.load_all():
+                    if record.get("id") not in seen:
+                        yield record
+                return
+            for record in rows:
+                record = overrides.get(record.get("id"), record)
+                if record is not None:
+                    seen.add(record.get("id"))
+                    yield record
+        yield from tail.values()
+
+    def get(self, rid):
+        """Fetch one record by reading only its segment and the log"""
+        self.ensure()
+        with self._shared():
+            found = None
+            manifest = self.load_manifest()
+            seg_id = manifest["locations"].get(rid)
+            if seg_id is not None:
+                for record in self.load_segment(seg_id):
+                    if record.get("id") == rid:
+                        found = record
+                        break
+            for entry in self.read_log():
+                if entry["op"] == "put" and entry["record"].get("id") == rid:
+                    found = entry["record"]
+                elif entry["op"] == "del" and entry["id"] == rid:
+                    found = None
+        return found
+
+    # ========== Writes ==========
+
+    def append(self, record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        self.ensure()
+        with self._exclusive():
+            self._append_log([{"op": "put", "record": r} for r in records])
+
+    def update(self, record):
+        self.append(record)
+
+    def delete(self, rid):
+        """Log a delete and return the removed record, or None if it was absent"""
+        with self._exclusive():
+            old = self.get(rid)
+            if old is None:
+                return None
+            self._append_log([{"op": "del", "id": rid}])
+            return old
+
+    def delete_many(self, rids):
+        """Log deletes for many ids in one append; ids not in the store are no-ops"""
+        rids = list(rids)
+        if not rids:
+            return
+        with self._exclusive():
+            self._append_log([{"op": "del", "id": rid} for rid in rids])
+
+    def replace_all(self, records):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._exclusive():
+            old_manifest = self._read_encrypted(self.manifest_path, None) or {"segments": [], "next_segment": 0}
+            # fresh segment ids, so a crash mid-rewrite never clobbers live segments
+            manifest = {"version": 1, "segments": [], "next_segment": old_manifest["next_segment"], "locations": {}}
+            for start in range(0, len(records), self.segment_size):
+                chunk = records[start:start + self.segment_size]
+                seg_id = manifest["next_segment"]
+                self._write_encrypted(self._segment_path(seg_id), chunk)
+                manifest["segments"].append(seg_id)
+                manifest["next_segment"] += 1
+                for record in chunk:
+                    manifest["locations"][record["id"]] = seg_id
+            self._write_encrypted(self.manifest_path, manifest)
+            open(self.log_path, "wb").close()
+            self.save_index(RecordIndex.build(records), RecordStats.build(records), _stat(self.manifest_path), 0)
+            for seg_id in old_manifest["segments"]:
+                if seg_id not in manifest["segments"]:
+                    try:
+                        os.remove(self._segment_path(seg_id))
+                    except OSError:
+                        pass
+
+    def clear(self):
+        self.replace_all([])
+
+    # ========== Compaction ==========
+
+    def compact(self):
+        """Fold the change log into the segments it touches and truncate it"""
+        with self._exclusive():
+            entries = self.read_log()
+            if not entries:
+                return 0
+            checkpoint = self.load_index()
+            if checkpoint:
+                index, stats, offset = checkpoint
+                pending = entries if offset == 0 else self.read_log_from(offset)[0]
+                index.apply(pending)
+                stats.apply(pending)
+            manifest = self.load_manifest()
+            locations = manifest["locations"]
+            loaded = {}
+            dirty = set()
+
+            def segment(seg_id):
+                if seg_id not in loaded:
+                    loaded[seg_id] = self.load_segment(seg_id)
+                return loaded[seg_id]
+
+            for entry in entries:
+                if entry["op"] == "put":
+                    record = entry["record"]
+                    rid = record["id"]
+                    seg_id = locations.get(rid)
+                    if seg_id is not None:
+                        rows = segment(seg_id)
+                        for i, row in enumerate(rows):
+                            if row.get("id") == rid:
+                                rows[i] = record
+                                break
+                        else:
+                            rows.append(record)
+                    else:
+                        tail = manifest["segments"][-1] if manifest["segments"] else None
+                        if tail is None or len(segment(tail)) >= self.segment_size:
+                            tail = manifest["next_segment"]
+                            manifest["next_segment"] += 1
+                            manifest["segments"].append(tail)
+                            loaded[tail] = []
+                        segment(tail).append(record)
+                        locations[rid] = seg_id = tail
+                    dirty.add(seg_id)
+                elif entry["op"] == "del":
+                    seg_id = locations.pop(entry["id"], None)
+                    if seg_id is not None:
+                        loaded[seg_id] = [r for r in segment(seg_id) if r.get("id") != entry["id"]]
+                        dirty.add(seg_id)
+
+            removed = []
+            for seg_id in dirty:
+                if loaded[seg_id]:
+                    self._write_encrypted(self._segment_path(seg_id), loaded[seg_id])
+                else:
+                    manifest["segments"].remove(seg_id)
+                    removed.append(seg_id)
+            self._write_encrypted(self.manifest_path, manifest)
+            open(self.log_path, "wb").close()
+            if checkpoint:
+                self.save_index(index, stats, _stat(self.manifest_path), 0)
+            elif os.path.exists(self.index_path):
+                # stale checkpoint, the next reader rebuilds it
+                os.remove(self.index_path)
+            for seg_id in removed:
+                try:
+                    os.remove(self._segment_path(seg_id))
+                except OSError:
+                    pass
+            return len(entries)
+
+    def _maybe_compact(self):
+        try:
+            if os.path.getsize(self.log_path) < self.compact_log_bytes:
+                return
+        except OSError:
+            return
+        if self._compactor and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact_quietly, daemon=True)
+        self._compactor.start()
+
+    def _compact_quietly(self):
+        try:
+            self.compact()
+        except Exception as e:
+            # runs on a background thread: nobody may be watching stdout
+            print(f"Compaction failed: {e}")
+            log_event("COMPACTION_FAIL", f"change log compaction failed: {e}")
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def apply_changes(records, entries):
+    """Replay change-log entries over a list of records, keeping insertion order"""
+    if not entries:
+        return records
+    positions = {r.get("id"): i for i, r in enumerate(records)}
+    for entry in entries:
+        if entry["op"] == "put":
+            rid = entry["record"].get("id")
+            if rid in positions:
+                records[positions[rid]] = entry["record"]
+            else:
+                positions[rid] = len(records)
+                records.append(entry["record"])
+        elif entry["op"] == "del":
+            i = positions.pop(entry["id"], None)
+            if i is not None:
+                records[i] = None
+    return [r for r in records if r is not None]
+
+
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = SegmentStore()
+    return _store
@@ -21,8 +21,16 @@ ROOT_DIR = os.path.dirname(os.path.abspath(__file__ + "/.."))
 DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
 USERS_PATH = os.path.join(DATA_DIR, "users.enc")
 RECORDS_PATH = os.path.join(DATA_DIR, "records.enc")
+STORE_DIR = os.path.join(DATA_DIR, "store")
 LOG_PATH = os.path.join(DATA_DIR, "logs.txt")
+LOG_CHAIN_PATH = os.path.join(DATA_DIR, "logs.chain")
+LOG_CHECKPOINT_PATH = os.path.join(DATA_DIR, "logs.chk")
+LOG_INDEX_PATH = os.path.join(DATA_DIR, "logs.idx")
+LOG_COUNTERS_PATH = os.path.join(DATA_DIR, "logs.counters")
+LOG_ARCHIVE_DIR = os.path.join(DATA_DIR, "log_archive")
 BACKUP_DIR = os.path.join(DATA_DIR, "backups")
+SESSIONS_PATH = os.path.join(DATA_DIR, "sessions.db")
+THROTTLE_PATH = os.path.join(DATA_DIR, "login_throttle.json")
 
 def timestamp():
     return datetime.utcnow().isoformat(sep=" ", timespec="seconds")
@@ -1,5 +1,11 @@
 import re
 import random
+from operator import mul
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class DataValidator:
     
@@ -161,6 +167,54 @@ class DataValidator:
         
         return True, "Valid national ID"
     
+    NATIONAL_ID_WEIGHTS = (10, 9, 8, 7, 6, 5, 4, 3, 2)
+    TEST_NATIONAL_IDS = {'1111111111', '1234567890', '0000000000', '9999999999'}
+    
+    @staticmethod
+    def validate_national_ids(national_ids):
+        """Batch form of validate_national_id: one bool per id, same rules.
+        Checksums for the whole column are computed at once with NumPy when
+        it is installed, otherwise over a single ASCII byte buffer."""
+        results = [False] * len(national_ids)
+        positions = []
+        digits = []
+        
+        for i, national_id in enumerate(national_ids):
+            if not national_id:
+                continue
+            national_id = national_id.strip()
+            if len(national_id) == 10 and national_id.isascii() and national_id.isdigit():
+                positions.append(i)
+                digits.append(national_id)
+            elif national_id.isdigit():
+                # non-ASCII digits still match the scalar pattern
+                results[i] = DataValidator.validate_national_id(national_id)[0]
+        
+        if not positions:
+            return results
+        
+        buffer = "".join(digits).encode()
+        if np is not None:
+            table = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, 10) - 48
+            remainder = table[:, :9].astype(np.int64) @ np.array(DataValidator.NATIONAL_ID_WEIGHTS) % 11
+            expected = np.where(remainder < 2, remainder, 11 - remainder)
+            valid = (expected == table[:, 9]) & ~(table == table[:, :1]).all(axis=1)
+            valid = valid.tolist()
+        else:
+            # bytes are already digit codes, so the '0' offset folds into one constant
+            offset = 48 * sum(DataValidator.NATIONAL_ID_WEIGHTS)
+            weights = DataValidator.NATIONAL_ID_WEIGHTS
+            valid = []
+            for start in range(0, len(buffer), 10):
+                remainder = (sum(map(mul, buffer[start:start + 9], weights)) - offset) % 11
+                expected = remainder if remainder < 2 else 11 - remainder
+                row = buffer[start:start + 10]
+                valid.append(expected == row[9] - 48 and row.count(row[0]) != 10)
+        
+        for i, ok, national_id in zip(positions, valid, digits):
+            results[i] = ok and national_id not in DataValidator.TEST_NATIONAL_IDS
+        return results
+    
     @staticmethod
     def validate_iranian_phone(phone):
         if not phone or not phone.strip():
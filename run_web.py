@@ -3,24 +3,36 @@
 import os
 import sys
 import socket
+import argparse
 
 # تنظیم مسیر
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-from web.app import app
-
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Datana Web Interface")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, help="worker processes (production mode)")
+    parser.add_argument('--threads', type=int, help="request threads per worker (production mode)")
+    parser.add_argument('--debug', action='store_true', help="single-process Flask development server")
+    args = parser.parse_args()
+
     hostname = socket.gethostname()
     local_ip = socket.gethostbyname(hostname)
-    
+
     print("=" * 60)
     print("Datana Web Interface")
     print("=" * 60)
-    print(f"Local access: http://127.0.0.1:5000")
-    print(f"Network access: http://{local_ip}:5000")
+    print(f"Local access: http://127.0.0.1:{args.port}")
+    print(f"Network access: http://{local_ip}:{args.port}")
     print("=" * 60)
     print("Press Ctrl+C to stop")
     print("=" * 60)
-    
-    app.run(debug=True, host='127.0.0.1', port=5000)
\ No newline at end of file
+
+    if args.debug:
+        from web.app import app
+        app.run(debug=True, host=args.host, port=args.port)
+    else:
+        from web.server import serve
+        serve(host=args.host, port=args.port, workers=args.workers, threads=args.threads)
@@ -1,7 +1,8 @@
 # web/app.py
+import io
 import os
 import sys
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response, stream_with_context
 
 # ========== مهم: تنظیم مسیر ==========
 # به دست آوردن مسیر ریشه پروژه
@@ -11,21 +12,25 @@ sys.path.insert(0, parent_dir)  # اضافه کردن ریشه به PATH
 # ====================================
 
 # حالا می‌تونه core رو پیدا کنه
-from core.auth import verify, load_users, save_users
+from core.auth import attempt_login
+from core.login_throttle import LoginBusy, BUSY_RETRY
 from core.database import (
     load_records, save_records, add_record, search_by_id, delete_record_by_id,
     advanced_search, get_system_stats, create_backup, get_available_backups,
-    restore_from_backup, get_exports_dir, export_csv
+    restore_from_backup, get_exports_dir, export_csv, get_recent_records,
+    iter_records, iter_csv_chunks, add_records_batch, read_import_rows, get_record_summary,
+    count_records
 )
 from core.analytics import Analytics
 from core.validators import DataValidator
-from core.logger import log
+from core.logger import log_event
 from core.utils import VERSION, DATA_DIR
 from core.reminders import ReminderSystem
 from core.jokes import JokeSystem
 from core.autobackup import autobackup_status, run_autobackup, update_autobackup_config
 from core.gamification import GamificationSystem  # این خط جدید
 from core.leaderboard import Leaderboard  # این خط جدید
+from web.sessions import init_sessions
 from datetime import datetime
 import psutil
 import time
@@ -33,7 +38,7 @@ import time
 app = Flask(__name__, 
             static_folder='static',
             static_url_path='/static')
-app.secret_key = os.urandom(24).hex()
+init_sessions(app)
 # ============================================
 # Web Routes
 # ============================================
@@ -50,7 +55,15 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         
-        user_info = verify(username, password)
+        try:
+            user_info, retry_after = attempt_login(username or '', password or '', request.remote_addr)
+        except LoginBusy:
+            flash('Server is busy. Please try again in a moment.', 'error')
+            return render_template('login.html', version=VERSION), 503, {'Retry-After': str(int(BUSY_RETRY))}
+        
+        if retry_after:
+            flash(f'Too many login attempts. Try again in {int(retry_after) + 1} seconds.', 'error')
+            return render_template('login.html', version=VERSION), 429, {'Retry-After': str(int(retry_after) + 1)}
         
         if user_info:
             session['username'] = username
@@ -81,8 +94,7 @@ def dashboard():
     stats = get_system_stats()
     joke = JokeSystem.get_random_joke()
     
-    records = load_records()
-    recent_records = records[-5:] if records else []
+    recent_records = get_recent_records(5)
     
     reminders = ReminderSystem.list_reminders()
     due_reminders = [r for r in reminders if not r.get('completed')][:3]
@@ -246,7 +258,7 @@ def add_record_web():
                 print(f"Gamification error: {e}")
             
             flash(f'Record added successfully! ID: {record_id}', 'success')
-            log(f"WEB_ADD: {session['username']} added record={record_id}")
+            log_event("WEB_ADD", "added record", user=session['username'], record_id=record_id)
             return redirect(url_for('records'))
             
         except ValueError as e:
@@ -432,7 +444,7 @@ def delete_record(record_id):
     
     if success:
         flash(f'Record {record_id} deleted successfully', 'success')
-        log(f"WEB_DELETE: {session['username']} deleted record={record_id}")
+        log_event("WEB_DELETE", "deleted record", user=session['username'], record_id=record_id)
     else:
         flash(f'Record {record_id} not found', 'error')
     
@@ -446,6 +458,10 @@ def export():
     stats = get_system_stats()
     
     if request.method == 'POST':
+        if session['role'] not in ['root', 'admin', 'staff']:
+            flash('You do not have permission to export records', 'error')
+            return redirect(url_for('export'))
+        
         count, path = export_csv()
         
         if count > 0 and path:
@@ -477,6 +493,55 @@ def export():
                          stats=stats,
                          version=VERSION)
 
+@app.route('/export/download')
+def export_download():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    if session['role'] not in ['root', 'admin', 'staff']:
+        flash('You do not have permission to export records', 'error')
+        return redirect(url_for('export'))
+    
+    filename = f"export_{time.strftime('%Y%m%d_%H%M%S')}.csv"
+    log_event("EXPORT", f"download={filename}", user=session['username'])
+    
+    # rows are encoded chunk by chunk, the full CSV is never held in memory
+    return Response(stream_with_context(iter_csv_chunks(iter_records())),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/import', methods=['POST'])
+def import_records():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    if session['role'] not in ['root', 'admin', 'staff']:
+        flash('You do not have permission to import records', 'error')
+        return redirect(url_for('dashboard'))
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Choose a CSV or JSON file to import', 'error')
+        return redirect(url_for('export'))
+    
+    format = 'json' if upload.filename.lower().endswith('.json') else 'csv'
+    
+    try:
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        added, errors = add_records_batch(read_import_rows(stream, format))
+    except (ValueError, UnicodeDecodeError) as e:
+        flash(f'Import failed: {e}', 'error')
+        return redirect(url_for('export'))
+    
+    flash(f'Imported {len(added)} records, {len(errors)} rejected', 'success' if added else 'error')
+    for row, message in errors[:10]:
+        flash(f'Row {row}: {message}', 'error')
+    if len(errors) > 10:
+        flash(f'... and {len(errors) - 10} more errors', 'error')
+    
+    log_event("WEB_IMPORT", f"file={upload.filename} added={len(added)} rejected={len(errors)}", user=session['username'])
+    return redirect(url_for('export'))
+
 @app.route('/backup', methods=['GET', 'POST'])
 def backup():
     if 'username' not in session:
@@ -525,18 +590,20 @@ def reports():
     
     report_type = request.args.get('type', 'user')
     
-    stats = get_system_stats()
+    # the page stats and the report share one record summary
+    summary = get_record_summary()
+    stats = get_system_stats(summary)
     
     if report_type == 'user':
-        report = Analytics.user_activity_report()
+        report = Analytics.user_activity_report(summary)
     elif report_type == 'data':
-        report = Analytics.data_quality_report()
+        report = Analytics.data_quality_report(summary)
     elif report_type == 'system':
-        report = Analytics.system_status_report()
+        report = Analytics.system_status_report(summary)
     elif report_type == 'security':
         report = Analytics.security_report()
     else:
-        report = Analytics.user_activity_report()
+        report = Analytics.user_activity_report(summary)
     
     return render_template('reports.html',
                          username=session['username'],
@@ -622,9 +689,7 @@ def api_monitoring_stats():
     memory = psutil.virtual_memory()
     disk = psutil.disk_usage('/')
     
-    # Datana stats
-    records = load_records()
-    users = load_users()
+    # Datana stats, from the running summary rather than the records
     stats = get_system_stats()
     
     # Uptime
@@ -635,8 +700,8 @@ def api_monitoring_stats():
     minutes = int((uptime_seconds % 3600) // 60)
     
     # Today's activity
-    today = datetime.now().date()
-    today_adds = sum(1 for r in records if r.get('created_at', '').startswith(str(today)))
+    today = str(datetime.now().date())
+    today_adds = count_records('created_at', lambda created: bool(created) and created.startswith(today))
     
     return jsonify({
         'cpu': round(cpu_percent, 1),
@@ -651,11 +716,11 @@ def api_monitoring_stats():
             'percent': disk.percent
         },
         'records': {
-            'total': len(records),
+            'total': stats['total_records'],
             'today': today_adds
         },
         'uptime': f"{days}d {hours}h {minutes}m",
-        'active_users': len(users),
+        'active_users': stats['total_users'],
         'db_size': f"{round(stats['data_size'] / 1024, 1)} KB",
         'last_backup': stats['last_backup'][:10] if stats['last_backup'] != 'No backups found' else 'Never',
         'activity': {
@@ -759,4 +824,10 @@ if __name__ == '__main__':
     print("Press Ctrl+C to stop")
     print("=" * 60)
     
-    app.run(debug=debug, host=host, port=port)
\ No newline at end of file
+    if debug:
+        app.run(debug=True, host=host, port=port)
+    else:
+        from web.server import serve
+        serve(host=host, port=port,
+              workers=int(os.environ.get('DATANA_WORKERS', 0)) or None,
+              threads=int(os.environ.get('DATANA_THREADS', 0)) or None)
\ No newline at end of file
@@ -0,0 +1,267 @@
+# web/server.py
+import os
+import sys
+import time
+import signal
+import socket
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(current_dir))
+
+from core.config_manager import get_web_config
+
+# Pre-fork production server for the web panel, standard library only. The
+# master binds the port and forks worker processes that all accept on the
+# shared socket; each worker answers requests from a fixed pool of threads and
+# only accepts a connection when one of them is free, so a slow request never
+# holds up the others. Workers import the app after the fork, so nothing of
+# the master's state is shared. The data directory is shared through its file
+# locks (core/file_lock.py), sessions through keys every worker derives alike
+# (web/sessions.py).
+#
+# Signals to the master:
+#   SIGHUP           graceful reload: start fresh workers (re-importing the
+#                    app), then let the old ones finish their requests and exit
+#   SIGTERM/SIGINT   graceful stop
+#   SIGTTIN/SIGTTOU  one worker more / less
+APP_TARGET = "web.app:app"
+RESPAWN_DELAY = 1.0
+
+
+class RequestHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        sys.stderr.write("[%s] [%d] %s - %s\n" % (
+            self.log_date_time_string(), os.getpid(), self.address_string(), format % args))
+        sys.stderr.flush()
+
+
+class PooledWSGIServer(WSGIServer):
+    """WSGIServer on an already listening socket with a fixed thread pool"""
+
+    def __init__(self, sock, app, threads):
+        WSGIServer.__init__(self, sock.getsockname()[:2], RequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        host, port = sock.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(app)
+        self._free = threading.Semaphore(threads)
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="datana-web")
+
+    def get_request(self):
+        # the listening socket is non-blocking: when another worker wins the
+        # connection, accept() fails and serve_forever() just carries on
+        self._free.acquire()
+        try:
+            request, client_address = self.socket.accept()
+        except BaseException:
+            self._free.release()
+            raise
+        request.setblocking(True)
+        return request, client_address
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._free.release()
+
+    def server_close(self):
+        # waits for the requests already being answered
+        self._pool.shutdown(wait=True)
+        self.socket.close()
+
+
+def load_app(target=APP_TARGET):
+    module, _, name = target.partition(":")
+    return getattr(importlib.import_module(module), name or "app")
+
+
+def bind(host, port, backlog=128):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def _flush_state():
+    # a worker leaves through os._exit, so flush what atexit would have
+    try:
+        from core.logger import flush_logs
+        from core import event_counters
+        flush_logs()
+        event_counters.save()
+    except Exception:
+        pass
+
+
+def run_worker(sock, threads, target=APP_TARGET):
+    """Serve on sock until SIGTERM/SIGINT, then finish open requests"""
+    state = {"server": None, "stopping": False}
+
+    def stop(signum, frame):
+        state["stopping"] = True
+        if state["server"] is not None:
+            # shutdown() waits for serve_forever(), so it can't run in this frame
+            threading.Thread(target=state["server"].shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server = state["server"] = PooledWSGIServer(sock, load_app(target), threads)
+    if state["stopping"]:
+        server.server_close()
+        return
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        server.server_close()
+        _flush_state()
+
+
+class Master:
+
+    def __init__(self, sock, workers, threads, graceful_timeout, target=APP_TARGET):
+        self.sock = sock
+        self.workers = max(1, workers)
+        self.threads = max(1, threads)
+        self.graceful_timeout = graceful_timeout
+        self.target = target
+        self.children = {}  # pid -> (generation, started)
+        self.retiring = {}  # pid -> deadline
+        self.generation = 0
+        self.signals = []
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                # reloads and resizing are the master's business
+                for signum in (signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+                    signal.signal(signum, signal.SIG_IGN)
+                run_worker(self.sock, self.threads, self.target)
+            except BaseException as e:
+                sys.stderr.write(f"Worker {os.getpid()} failed: {e}\n")
+                code = 1
+            finally:
+                sys.stderr.flush()
+                os._exit(code)
+        self.children[pid] = (self.generation, time.monotonic())
+        return pid
+
+    def _retire(self, pids):
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.children.pop(pid, None)
+            self.retiring[pid] = deadline
+            self._kill(pid, signal.SIGTERM)
+
+    def _kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.retiring.pop(pid, None)
+            info = self.children.pop(pid, None)
+            if info is not None:
+                print(f" Worker {pid} exited unexpectedly (status {status}), restarting", flush=True)
+                if time.monotonic() - info[1] < RESPAWN_DELAY:
+                    time.sleep(RESPAWN_DELAY)
+
+    def _on_signal(self, signum, frame):
+        self.signals.append(signum)
+
+    def reload(self):
+        print(f" Reloading: starting {self.workers} fresh workers", flush=True)
+        old = list(self.children)
+        self.generation += 1
+        for _ in range(self.workers):
+            self._spawn()
+        self._retire(old)
+
+    def run(self):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, self._on_signal)
+        try:
+            while True:
+                self._reap()
+                while self.signals:
+                    signum = self.signals.pop(0)
+                    if signum in (signal.SIGTERM, signal.SIGINT):
+                        return
+                    if signum == signal.SIGHUP:
+                        self.reload()
+                    elif signum == signal.SIGTTIN:
+                        self.workers += 1
+                    elif signum == signal.SIGTTOU and self.workers > 1:
+                        self.workers -= 1
+                        self._retire([max(self.children, key=lambda pid: self.children[pid][1])])
+                while len(self.children) < self.workers:
+                    self._spawn()
+                now = time.monotonic()
+                for pid, deadline in list(self.retiring.items()):
+                    if now > deadline:
+                        self._kill(pid, signal.SIGKILL)
+                time.sleep(0.2)
+        finally:
+            self.stop()
+
+    def stop(self):
+        print(" Stopping workers...", flush=True)
+        self._retire(list(self.children))
+        while self.retiring:
+            self._reap()
+            now = time.monotonic()
+            for pid, deadline in list(self.retiring.items()):
+                if now > deadline:
+                    self._kill(pid, signal.SIGKILL)
+            time.sleep(0.1)
+        self.sock.close()
+
+
+def serve(host="127.0.0.1", port=5000, workers=None, threads=None, target=APP_TARGET):
+    """Run the production server until it is stopped"""
+    config = get_web_config()
+    workers = workers or config["workers"]
+    threads = threads or config["threads"]
+
+    sock = bind(host, port)
+    if not hasattr(os, "fork"):
+        # Windows: one process, but still a pool of request threads
+        print(f" Serving on http://{host}:{port} (1 process, {threads} threads)", flush=True)
+        run_worker(sock, threads, target)
+        return
+
+    print(f" Serving on http://{host}:{port} ({workers} workers x {threads} threads, master PID {os.getpid()})", flush=True)
+    Master(sock, workers, threads, config["graceful_timeout"], target).run()
+
+
+if __name__ == '__main__':
+    serve(host=os.environ.get('FLASK_HOST', '127.0.0.1'),
+          port=int(os.environ.get('FLASK_PORT', 5000)),
+          workers=int(os.environ.get('DATANA_WORKERS', 0)) or None,
+          threads=int(os.environ.get('DATANA_THREADS', 0)) or None)
@@ -0,0 +1,138 @@
+# web/sessions.py
+import time
+import secrets
+import sqlite3
+import threading
+from flask.sessions import SessionInterface, SessionMixin, SecureCookieSessionInterface
+from flask.json.tag import TaggedJSONSerializer
+from itsdangerous import BadSignature, Signer, URLSafeTimedSerializer
+from werkzeug.datastructures import CallbackDict
+from core.config_manager import get_session_keys, get_web_config
+from core.utils import SESSIONS_PATH
+
+# Sessions are signed with keys derived from the Datana key (see
+# config_manager.get_session_keys), so any worker can read a cookie issued by
+# another one and a restart logs nobody out. With session_store "sqlite" the
+# session itself stays on the server and the cookie only carries its signed id.
+PURGE_INTERVAL = 600
+
+
+class DatanaCookieSessionInterface(SecureCookieSessionInterface):
+    """Flask's signed cookie session, signed with the derived keys"""
+
+    def get_signing_serializer(self, app):
+        return URLSafeTimedSerializer(
+            get_session_keys(),
+            salt=self.salt,
+            serializer=self.serializer,
+            signer_kwargs={"key_derivation": self.key_derivation, "digest_method": self.digest_method},
+        )
+
+
+class ServerSession(CallbackDict, SessionMixin):
+
+    def __init__(self, initial=None, sid=None, new=False, refresh=False):
+        def on_update(session):
+            session.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.refresh = refresh
+        self.modified = False
+        # a login or logout gets a fresh id (no session fixation)
+        self.loaded_user = self.get("username")
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """Sessions in a SQLite table shared by every worker process"""
+
+    serializer = TaggedJSONSerializer()
+    salt = "datana-session-id"
+
+    def __init__(self, path=SESSIONS_PATH, hours=12):
+        self.path = path
+        self.lifetime = hours * 3600
+        self._local = threading.local()
+        self._purged_at = 0.0
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS sessions "
+                       "(sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)")
+            db.commit()
+        return db
+
+    def _signer(self):
+        return Signer(get_session_keys(), salt=self.salt)
+
+    def _new_session(self):
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return self._new_session()
+        try:
+            sid = self._signer().unsign(cookie).decode()
+        except BadSignature:
+            return self._new_session()
+        row = self._db().execute("SELECT data, expires FROM sessions WHERE sid = ? AND expires > ?",
+                                 (sid, time.time())).fetchone()
+        if row is None:
+            return self._new_session()
+        # idle expiry slides forward, rewritten once half the lifetime is used
+        refresh = row[1] - time.time() < self.lifetime / 2
+        return ServerSession(self.serializer.loads(row[0]), sid=sid, refresh=refresh)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        db = self._db()
+
+        if not session:
+            if not session.new:
+                db.execute("DELETE FROM sessions WHERE sid = ?", (session.sid,))
+                db.commit()
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       httponly=self.get_cookie_httponly(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        if not (session.modified or session.refresh or session.new):
+            return
+        if not session.new and session.get("username") != session.loaded_user:
+            db.execute("DELETE FROM sessions WHERE sid = ?", (session.sid,))
+            session.sid = secrets.token_urlsafe(32)
+            session.new = True
+        now = time.time()
+        db.execute("INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+                   (session.sid, self.serializer.dumps(dict(session)), now + self.lifetime))
+        if now - self._purged_at > PURGE_INTERVAL:
+            db.execute("DELETE FROM sessions WHERE expires <= ?", (now,))
+            self._purged_at = now
+        db.commit()
+
+        if session.new or session.permanent:
+            response.set_cookie(name, self._signer().sign(session.sid).decode(),
+                                expires=self.get_expiration_time(app, session),
+                                domain=domain, path=path,
+                                secure=self.get_cookie_secure(app),
+                                httponly=self.get_cookie_httponly(app),
+                                samesite=self.get_cookie_samesite(app))
+        session.new = False
+
+
+def init_sessions(app):
+    """Install the configured session interface on app"""
+    config = get_web_config()
+    # flask only checks that a key is set; the interfaces sign with get_session_keys()
+    app.secret_key = get_session_keys()[-1]
+    if config["session_store"] == "sqlite":
+        app.session_interface = SQLiteSessionInterface(SESSIONS_PATH, config["session_hours"])
+    else:
+        app.session_interface = DatanaCookieSessionInterface()